@@ -8,10 +8,15 @@ migrate = Migrate()
 
 def create_app():
     app = Flask(__name__)
+
+    # Spool multipart file parts to disk past a small threshold instead of holding them in memory
+    from utils.uploads import SpooledRequest
+    app.request_class = SpooledRequest
     CORS(app,
         resources={r"/*": {
             "origins": ["http://localhost:5173", "http://127.0.0.1:5173"],
-            "allow_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin"],
+            "allow_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin", "X-DB-Position"],
+            "expose_headers": ["X-Trace-Id", "X-Profile-Id", "X-DB-Position"],
             "supports_credentials": True,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
         }})
@@ -22,9 +27,79 @@ def create_app():
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
+    # Blob storage: 'local' keeps files under the folders above, 's3' uses an S3-compatible bucket
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+    app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+    app.config['S3_PREFIX'] = os.environ.get('S3_PREFIX', '')
+    app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+    app.config['S3_REGION'] = os.environ.get('S3_REGION')
+    app.config['S3_MULTIPART_THRESHOLD'] = int(os.environ.get('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024))
+    app.config['S3_MULTIPART_CHUNKSIZE'] = int(os.environ.get('S3_MULTIPART_CHUNKSIZE', 16 * 1024 * 1024))
+    app.config['STORAGE_CACHE_MAX_BYTES'] = int(os.environ.get('STORAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Result overlays are encoded and written in the background
+    app.config['ARTIFACT_FORMAT'] = os.environ.get('ARTIFACT_FORMAT', 'jpeg')
+    app.config['ARTIFACT_JPEG_QUALITY'] = int(os.environ.get('ARTIFACT_JPEG_QUALITY', 90))
+    app.config['ARTIFACT_WEBP_QUALITY'] = int(os.environ.get('ARTIFACT_WEBP_QUALITY', 85))
+    app.config['ARTIFACT_PNG_COMPRESSION'] = int(os.environ.get('ARTIFACT_PNG_COMPRESSION', 3))
+    app.config['ARTIFACT_FSYNC'] = os.environ.get('ARTIFACT_FSYNC', 'never')
+    # '1' keeps overlay writes on the response path so committed rows only reference files that exist.
+    # By default rows commit first and mark the overlay pending; other workers wait for it up to
+    # ARTIFACT_WAIT_TIMEOUT, and markers older than ARTIFACT_PENDING_SECONDS count as failed writes
+    app.config['ARTIFACT_AWAIT_COMMIT'] = os.environ.get('ARTIFACT_AWAIT_COMMIT', '0') == '1'
+    app.config['ARTIFACT_PENDING_SECONDS'] = int(os.environ.get('ARTIFACT_PENDING_SECONDS', 60))
+    app.config['ARTIFACT_WORKERS'] = int(os.environ.get('ARTIFACT_WORKERS', 2))
+
+    # Browser cache lifetime for stored images; content-addressed blobs never change
+    app.config['BLOB_CACHE_MAX_AGE'] = int(os.environ.get('BLOB_CACHE_MAX_AGE', 365 * 24 * 3600))
+    app.config['LEGACY_BLOB_MAX_AGE'] = int(os.environ.get('LEGACY_BLOB_MAX_AGE', 3600))
+
+    # Thumbnails and previews for history views
+    app.config['DERIVATIVES_FOLDER'] = os.path.join(app.root_path, 'derivatives')
+    app.config['DERIVATIVE_FORMAT'] = os.environ.get('DERIVATIVE_FORMAT', 'webp')
+    app.config['DERIVATIVE_QUALITY'] = int(os.environ.get('DERIVATIVE_QUALITY', 80))
+    app.config['DERIVATIVE_WORKERS'] = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+
     # Set YOLO model path
     app.config['YOLO_MODEL_PATH'] = os.environ.get('YOLO_MODEL_PATH', 'models/keypoint/best.pt')
 
+    # 'yolo' loads trained weights, 'fake' uses the local FakeYOLO stand-in (FAKE_MODEL_* settings)
+    app.config['MODEL_BACKEND'] = os.environ.get('MODEL_BACKEND', 'yolo')
+    for key, value in os.environ.items():
+        if key.startswith('FAKE_MODEL_'):
+            app.config[key] = value
+
+    # Inference scheduling between interactive uploads and bulk jobs
+    app.config['INFERENCE_SCHEDULING_POLICY'] = os.environ.get('INFERENCE_SCHEDULING_POLICY', 'weighted')
+    app.config['INFERENCE_CONCURRENCY'] = int(os.environ.get('INFERENCE_CONCURRENCY', 1))
+    app.config['INFERENCE_INTERACTIVE_WEIGHT'] = int(os.environ.get('INFERENCE_INTERACTIVE_WEIGHT', 4))
+    app.config['INFERENCE_BULK_WEIGHT'] = int(os.environ.get('INFERENCE_BULK_WEIGHT', 1))
+    app.config['INFERENCE_STARVATION_SECONDS'] = float(os.environ.get('INFERENCE_STARVATION_SECONDS', 30))
+
+    # Upload limits; bodies over MAX_CONTENT_LENGTH are rejected with 413 before they are read
+    app.config['MAX_IMAGE_SIZE'] = int(os.environ.get('MAX_IMAGE_SIZE', 10 * 1024 * 1024))
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', app.config['MAX_IMAGE_SIZE'] + 64 * 1024))
+    app.config['UPLOAD_SPOOL_THRESHOLD'] = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 512 * 1024))
+    app.config['UPLOAD_SPOOL_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.incoming')
+
+    # History pagination
+    app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+    app.config['HISTORY_MAX_PAGE_SIZE'] = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 200))
+
+    # Analytics rollup: days within this window of the last refresh are recomputed
+    app.config['ANALYTICS_SETTLE_SECONDS'] = int(os.environ.get('ANALYTICS_SETTLE_SECONDS', 600))
+    app.config['ANALYTICS_DEFAULT_DAYS'] = int(os.environ.get('ANALYTICS_DEFAULT_DAYS', 30))
+
+    # Keypoint persistence: 'packed' (array column), 'rows' (keypoints table) or 'both'.
+    # Reads fall back to the table for detections not yet converted by `flask keypoints-repack`
+    app.config['KEYPOINT_STORAGE'] = os.environ.get('KEYPOINT_STORAGE', 'packed')
+
+    # Batch analysis limits. /analyze/batch replaces MAX_CONTENT_LENGTH with BATCH_MAX_CONTENT_LENGTH
+    # for the whole body (413 when exceeded) and still holds each image part to MAX_IMAGE_SIZE
+    app.config['ANALYZE_BATCH_SIZE'] = int(os.environ.get('ANALYZE_BATCH_SIZE', 8))
+    app.config['BATCH_MAX_IMAGES'] = int(os.environ.get('BATCH_MAX_IMAGES', 200))
+    app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 500 * 1024 * 1024))
+
     # Initialize database
     init_db(app)
 
@@ -35,7 +110,7 @@ def create_app():
     migrate.init_app(app, db)
 
     # Import models explicitly to ensure migration works
-    from models import User, KeypointDetection, Keypoint
+    from models import User, KeypointDetection, Keypoint, DetectionDailyStats, AnalyticsRefresh
 
     # Import routes after app is created to avoid circular imports
     from routes import init_app as init_routes
@@ -45,7 +120,27 @@ def create_app():
     from services import init_app as init_services
     init_services(app)
 
+    # Register CLI commands
+    from commands import init_app as init_commands
+    init_commands(app)
+
+    # Request-scoped tracing with head sampling
+    from utils.tracing import init_app as init_tracing
+    init_tracing(app)
+
+    # Sampled per-request memory accounting and the RSS watchdog
+    from utils.memory import init_app as init_memory
+    init_memory(app)
+
+    # Enable on-demand profiling of single requests for admins
+    from utils.profiling import init_app as init_profiling
+    init_profiling(app)
+
     # Add an error handler for 500 errors
+    @app.errorhandler(413)
+    def handle_413(error):
+        return {"status": "error", "message": "Upload is too large."}, 413
+
     @app.errorhandler(500)
     def handle_500(error):
         app.logger.error(f"Internal Server Error: {error}")
@@ -0,0 +1,249 @@
+"""Per-stage pipeline benchmarks with stored baselines.
+
+Run from the backend directory:
+
+    python -m benchmarks.run                      # stub models, compare with baseline
+    python -m benchmarks.run --update-baseline    # store the current numbers
+    python -m benchmarks.run --real               # use the configured YOLO weights
+    python -m benchmarks.run --threshold 0.2 --stage-threshold db_persist=0.5
+
+Exits with status 1 when a stage regresses beyond its threshold.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+from flask import Flask, jsonify
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from config import db
+from models import User
+from services import keypoint_service, segmentation_service, upload_store, result_store
+from services.fake_model import FakeYOLO, synthetic_radiograph
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def time_stage(fn, iterations, warmup):
+    """Return per-call durations in milliseconds"""
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+def summarize(durations):
+    ordered = sorted(durations)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[p95_index],
+        "mean_ms": statistics.fmean(ordered),
+        "iterations": len(ordered)
+    }
+
+def create_bench_app(workdir):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def load_models(app, real):
+    if real:
+        from ultralytics import YOLO
+        keypoint_service.model = YOLO(os.environ.get('YOLO_MODEL_PATH', 'models/keypoint/best.pt'), task='pose')
+        segmentation_service.model = YOLO(
+            os.environ.get('SEGMENTATION_MODEL_PATH', 'models/segmentation/best.pt'), task='segment'
+        )
+    else:
+        keypoint_service.model = FakeYOLO(task='pose')
+        segmentation_service.model = FakeYOLO(task='segment')
+
+    for service in (keypoint_service, segmentation_service):
+        service.app = app
+        service.scheduler = None
+
+def build_stages(app, workdir, image_bytes):
+    """Return an ordered list of (name, callable) pairs, one per pipeline stage"""
+    from routes.prediction import validate_image
+
+    upload_store.configure(os.path.join(workdir, 'uploads'))
+    result_store.configure(os.path.join(workdir, 'results'))
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+
+    # Prepare the intermediate inputs each stage needs once, outside the timings
+    seg_results = segmentation_service._predict(image)
+    kp_results = keypoint_service._predict(image)
+    segmentation_data = segmentation_service._process_results(seg_results)
+    category_names = keypoint_service._get_category_names()
+    kpts = kp_results[0].keypoints.data[0]
+    _, keypoints_dict, _ = keypoint_service._extract_keypoints(kp_results[0], kpts, category_names)
+    analysis = keypoint_service.perform_dental_analysis(keypoints_dict, segmentation_data)
+    mask_arrays = [mask.data.cpu().numpy().squeeze() for mask in seg_results[0].masks]
+
+    user = User(username='bench', email='bench@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    counter = {"id": 0}
+
+    def validation():
+        validate_image(io.BytesIO(image_bytes))
+
+    def save_image():
+        # Remove the blob each time so the write is measured rather than the dedup hit
+        path = keypoint_service.save_image(FileStorage(stream=io.BytesIO(image_bytes), filename='bench.jpg'))
+        os.remove(path)
+
+    def mask_to_polygon():
+        for mask_array in mask_arrays:
+            segmentation_service._mask_to_polygon(mask_array)
+
+    def keypoint_extraction():
+        keypoint_service._extract_keypoints(kp_results[0], kpts, category_names)
+
+    def dental_analysis():
+        keypoint_service.perform_dental_analysis(keypoints_dict, segmentation_data)
+
+    def overlay_render():
+        for results in (seg_results, kp_results):
+            cv2.imencode('.jpg', results[0].plot())
+
+    def json_serialisation():
+        jsonify({
+            'status': 'success',
+            'detection': {'analysis': analysis, 'keypoints': keypoints_dict},
+            'segmentation': segmentation_data
+        }).get_data()
+
+    def db_persist():
+        counter["id"] += 1
+        detection_id = f"bench-{counter['id']}"
+        keypoint_service.persist_detections([(
+            dict(
+                id=detection_id,
+                user_id=user_id,
+                image_path='bench.jpg',
+                result_path='bench_result.jpg',
+                confidence_score=0.9,
+                prediction_result=analysis["prediction_result"],
+                analysis=analysis
+            ),
+            [{"label": label, **point} for label, point in keypoints_dict.items()]
+        )])
+        db.session.commit()
+
+    stages = [
+        ('image_validation', validation),
+        ('save_image', save_image),
+        ('segmentation_inference', lambda: segmentation_service._predict(image)),
+        ('keypoint_inference', lambda: keypoint_service._predict(image)),
+        ('mask_to_polygon', mask_to_polygon),
+        ('keypoint_extraction', keypoint_extraction),
+        ('dental_analysis', dental_analysis),
+        ('overlay_render', overlay_render),
+        ('json_serialisation', json_serialisation),
+        ('db_persist', db_persist)
+    ]
+    return stages
+
+def compare(results, baseline, threshold, stage_thresholds):
+    """Return a list of (stage, current, baseline, allowed) regressions"""
+    regressions = []
+    for stage, current in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        allowed = stage_thresholds.get(stage, threshold)
+        if current["median_ms"] > previous["median_ms"] * (1 + allowed):
+            regressions.append((stage, current["median_ms"], previous["median_ms"], allowed))
+    return regressions
+
+def parse_stage_thresholds(values):
+    thresholds = {}
+    for value in values:
+        stage, _, limit = value.partition('=')
+        thresholds[stage] = float(limit)
+    return thresholds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--real', action='store_true', help='Use the configured YOLO weights instead of stubs')
+    parser.add_argument('--image', help='Benchmark with this radiograph instead of a synthetic one')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed relative slowdown of the median before a stage fails')
+    parser.add_argument('--stage-threshold', action='append', default=[], metavar='STAGE=RATIO',
+                        help='Override the threshold for a single stage')
+    parser.add_argument('--stage', action='append', default=[], help='Only run the named stage(s)')
+    args = parser.parse_args(argv)
+
+    mode = 'real' if args.real else 'stub'
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_radiograph()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_bench_app(workdir)
+        with app.app_context():
+            db.create_all()
+            load_models(app, args.real)
+
+            results = {}
+            for name, fn in build_stages(app, workdir, image_bytes):
+                if args.stage and name not in args.stage:
+                    continue
+                results[name] = summarize(time_stage(fn, args.iterations, args.warmup))
+                print(f"{name:<24} median {results[name]['median_ms']:9.3f} ms   "
+                      f"p95 {results[name]['p95_ms']:9.3f} ms")
+
+            db.session.remove()
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            stored = json.load(f)
+
+    if args.update_baseline or mode not in stored:
+        stored[mode] = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": {**stored.get(mode, {}).get("stages", {}), **results}
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f"Baseline for '{mode}' mode saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, stored[mode]["stages"], args.threshold,
+                          parse_stage_thresholds(args.stage_threshold))
+    for stage, current, previous, allowed in regressions:
+        print(f"REGRESSION {stage}: {current:.3f} ms vs baseline {previous:.3f} ms (allowed +{allowed:.0%})")
+
+    if regressions:
+        return 1
+
+    print(f"No regressions against the '{mode}' baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+def init_app(app):
+    # Import and register CLI commands here
+    from commands.ingest import ingest_folder
+    from commands.storage_gc import storage_gc
+    from commands.analytics import analytics_refresh
+    from commands.keypoints import keypoints_repack
+
+    app.cli.add_command(ingest_folder)
+    app.cli.add_command(storage_gc)
+    app.cli.add_command(analytics_refresh)
+    app.cli.add_command(keypoints_repack)
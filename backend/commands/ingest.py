@@ -0,0 +1,236 @@
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+import click
+import cv2
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+
+from config import db
+from models import User, KeypointDetection
+from services import keypoint_service, segmentation_service, BULK
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def _decode_image(path):
+    """Decode one image in a worker process; returns (path, handle, error).
+
+    The pixels are left in a shared memory segment and only its name, shape and
+    dtype travel back, so decoded arrays are never pickled through the pool.
+    """
+    try:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            return path, None, 'Could not decode image'
+        height, width = image.shape[:2]
+        if width < 200 or height < 200:
+            return path, None, 'Image is too small. Minimum dimensions are 200x200 pixels.'
+        segment = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=segment.buf)[:] = image
+        except Exception:
+            segment.close()
+            segment.unlink()
+            raise
+        segment.close()
+        return path, (segment.name, image.shape, image.dtype.str), None
+    except Exception as e:
+        return path, None, str(e)
+
+def _attach_image(handle):
+    """Copy a decoded image out of its shared memory segment and free the segment"""
+    name, shape, dtype = handle
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        view = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        image = view.copy()
+        del view
+    finally:
+        segment.close()
+        segment.unlink()
+    return image
+
+def _iter_image_paths(root):
+    """Walk the directory tree in a stable order and yield image file paths"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS) and not filename.startswith('.'):
+                yield os.path.join(dirpath, filename)
+
+def _load_checkpoint(path):
+    """Return the set of source paths already recorded in the checkpoint file"""
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    # A line cut short by an interruption; that image is simply redone
+                    continue
+    return done
+
+def _resolve_user(user):
+    if user.isdigit():
+        return User.query.get(int(user))
+    return User.query.filter_by(username=user).first()
+
+@click.command('ingest-folder')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--user', 'user', required=True, help='Username or id that will own the imported detections.')
+@click.option('--batch-size', default=16, show_default=True, help='Images per model call and per commit.')
+@click.option('--workers', default=None, type=int, help='Decode processes (default: CPU count).')
+@click.option('--prefetch', default=4, show_default=True, help='Batches decoded ahead of inference.')
+@click.option('--checkpoint', default=None, help='Checkpoint file (default: <directory>/.ingest_checkpoint.jsonl).')
+@with_appcontext
+def ingest_folder(directory, user, batch_size, workers, prefetch, checkpoint):
+    """Import an archive of radiographs and run the full analysis pipeline on it.
+
+    Model calls are queued as bulk work in this process only; they do not yield
+    to uploads served by the API workers.
+    """
+    owner = _resolve_user(user)
+    if owner is None:
+        raise click.ClickException(f"User not found: {user}")
+
+    directory = os.path.abspath(directory)
+    checkpoint = checkpoint or os.path.join(directory, '.ingest_checkpoint.jsonl')
+    done = _load_checkpoint(checkpoint)
+    paths = [p for p in _iter_image_paths(directory) if os.path.relpath(p, directory) not in done]
+
+    click.echo(f"Found {len(paths)} images to import ({len(done)} already in checkpoint)")
+    if not paths:
+        return
+
+    workers = workers or os.cpu_count() or 1
+    # Started before the pool so workers share it: segments are then tracked once,
+    # released on unlink here, and cleaned up if this process dies mid-import
+    resource_tracker.ensure_running()
+    processed = 0
+    failed = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(checkpoint, 'a') as checkpoint_file:
+        # Keep decode work queued ahead of inference so the pool never idles
+        in_flight = deque()
+        path_iter = iter(paths)
+
+        def fill():
+            while len(in_flight) < batch_size * prefetch:
+                path = next(path_iter, None)
+                if path is None:
+                    return
+                in_flight.append(pool.submit(_decode_image, path))
+
+        fill()
+        while in_flight:
+            decoded = []
+            while in_flight and len(decoded) < batch_size:
+                decoded.append(in_flight.popleft().result())
+            fill()
+
+            records = []
+            batch = []
+            for path, handle, error in decoded:
+                relpath = os.path.relpath(path, directory)
+                if error:
+                    records.append({'path': relpath, 'status': 'error', 'message': error})
+                else:
+                    batch.append((relpath, path, _attach_image(handle)))
+
+            if batch:
+                records.extend(_ingest_batch(batch, owner.id))
+
+            for record in records:
+                # Batches that failed as a whole stay out of the checkpoint so they are retried on resume
+                if not record.pop('retry', False):
+                    checkpoint_file.write(json.dumps(record) + '\n')
+                if record['status'] == 'success':
+                    processed += 1
+                else:
+                    failed += 1
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+            elapsed = time.monotonic() - started
+            rate = (processed + failed) / elapsed if elapsed > 0 else 0.0
+            click.echo(f"{processed + failed}/{len(paths)} images ({failed} failed), {rate:.2f} images/sec")
+
+    elapsed = time.monotonic() - started
+    click.echo(f"Imported {processed} images in {elapsed:.1f}s, {failed} failed")
+
+def _ingest_batch(batch, user_id):
+    """Run the pipeline on one decoded batch and commit all of its rows together.
+
+    Returns one record per image; if the batch fails as a whole they are all
+    errors flagged for retry. Images the owner already has a detection for are
+    not analysed again, so a crash between the commit and the checkpoint write
+    does not import them twice on resume.
+    """
+    image_paths = [keypoint_service.save_image_from_path(path) for _, path, _ in batch]
+    records = []
+
+    existing = dict(
+        KeypointDetection.query
+        .with_entities(KeypointDetection.image_path, KeypointDetection.id)
+        .filter(
+            KeypointDetection.user_id == user_id,
+            KeypointDetection.image_path.in_({os.path.basename(image_path) for image_path in image_paths})
+        )
+    )
+    pending = []
+    for item, image_path in zip(batch, image_paths):
+        detection_id = existing.get(os.path.basename(image_path))
+        if detection_id is None:
+            pending.append((item, image_path))
+        else:
+            records.append({'path': item[0], 'status': 'success', 'detection_id': detection_id})
+    if not pending:
+        return records
+    skipped = list(records)
+    batch = [item for item, _ in pending]
+    image_paths = [image_path for _, image_path in pending]
+    images = [image for _, _, image in batch]
+
+    try:
+        segmentations = segmentation_service.get_tooth_segmentation_batch(image_paths, priority=BULK, images=images)
+
+        ready = []
+        for (relpath, _, _), image_path, image, segmentation in zip(batch, image_paths, images, segmentations):
+            if segmentation.get('status') == 'error':
+                records.append({'path': relpath, 'status': 'error', 'message': segmentation['message']})
+            else:
+                ready.append((relpath, image_path, image, segmentation))
+
+        if ready:
+            detections = keypoint_service.detect_keypoints_batch(
+                [image_path for _, image_path, _, _ in ready],
+                user_id,
+                segmentation_batch=[segmentation for _, _, _, segmentation in ready],
+                priority=BULK,
+                images=[image for _, _, image, _ in ready],
+                commit=False
+            )
+            for (relpath, _, _, _), detection in zip(ready, detections):
+                if detection.get('status') == 'error':
+                    records.append({'path': relpath, 'status': 'error', 'message': detection['message']})
+                else:
+                    records.append({'path': relpath, 'status': 'success', 'detection_id': detection['detection_id']})
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error ingesting batch: {str(e)}")
+        # Every image of the batch failed, including any already marked successful
+        return skipped + [{'path': relpath, 'status': 'error', 'message': str(e), 'retry': True} for relpath, _, _ in batch]
+
+    return records
@@ -0,0 +1,16 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+
+from services import keypoint_service
+
+@click.command('keypoints-repack')
+@click.option('--batch-size', default=1000, show_default=True, help='Detections packed per commit.')
+@with_appcontext
+def keypoints_repack(batch_size):
+    """Pack keypoints of older detections so reads no longer touch the keypoints table."""
+    started = time.monotonic()
+    repacked = keypoint_service.repack_keypoints(batch_size=batch_size)
+    elapsed = time.monotonic() - started
+    click.echo(f"Repacked keypoints of {repacked} detections in {elapsed:.1f}s")
@@ -0,0 +1,167 @@
+import os
+import time
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_
+
+from config import db
+from models import KeypointDetection, PendingArtifact
+from services import upload_store, result_store, derivative_service
+from services.storage import QUARANTINE_PREFIX
+
+# Columns that reference blobs in each store
+REFERENCES = {
+    'uploads': (KeypointDetection.image_path,),
+    'results': (KeypointDetection.result_path, KeypointDetection.segmentation_path)
+}
+
+# Staging directories inside a local store root that only ever hold transient files
+STAGING_DIRS = ('.tmp', '.incoming')
+
+def _iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _legacy_references(columns):
+    """Basenames of rows written before blob keys, which stored absolute file paths.
+
+    Only those older rows are loaded; rows with blob keys are checked batch by batch.
+    """
+    names = set()
+    for column in columns:
+        rows = KeypointDetection.query.with_entities(column).filter(column.like('%/%')).yield_per(1000)
+        for (value,) in rows:
+            names.add(os.path.basename(value))
+    return names
+
+def _referenced(columns, keys):
+    """Return the subset of keys that some detection row points at"""
+    found = set()
+    rows = KeypointDetection.query.with_entities(*columns).filter(or_(*[column.in_(keys) for column in columns]))
+    for row in rows:
+        found.update(value for value in row if value in keys)
+    return found
+
+def _clean_staging(store, cutoff, dry_run):
+    """Remove partial writes and spooled uploads abandoned by crashed requests"""
+    removed = 0
+    reclaimed = 0
+    for directory in STAGING_DIRS:
+        path = os.path.join(store.root, directory)
+        if not os.path.isdir(path):
+            continue
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+                removed += 1
+                reclaimed += stat.st_size
+    return removed, reclaimed
+
+def _remove_derivatives(store_name, key, dry_run):
+    reclaimed = 0
+    # Includes renditions left over from earlier DERIVATIVE_FORMAT or DERIVATIVE_QUALITY settings
+    for path in derivative_service.renditions(store_name, key):
+        try:
+            size = os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        reclaimed += size
+    return reclaimed
+
+@click.command('storage-gc')
+@click.option('--store', 'store_names', type=click.Choice(['uploads', 'results']), multiple=True,
+              help='Store to collect (default: both).')
+@click.option('--grace-hours', default=24.0, show_default=True,
+              help='Only collect objects older than this, so in-flight requests keep their files.')
+@click.option('--batch-size', default=1000, show_default=True, help='Objects checked against the database per query.')
+@click.option('--delete', 'delete', is_flag=True, help='Delete orphans instead of moving them to .quarantine/.')
+@click.option('--purge-quarantine', is_flag=True,
+              help='Also delete quarantined objects that have been there longer than the grace period.')
+@click.option('--dry-run', is_flag=True, help='Report what would be collected without touching anything.')
+@with_appcontext
+def storage_gc(store_names, grace_hours, batch_size, delete, purge_quarantine, dry_run):
+    """Collect uploads and results that no detection references."""
+    stores = {'uploads': upload_store, 'results': result_store}
+    cutoff = time.time() - grace_hours * 3600
+    action = 'would remove' if dry_run else ('deleted' if delete else 'quarantined')
+    total_reclaimed = 0
+
+    for store_name in store_names or stores:
+        store = stores[store_name]
+        columns = REFERENCES[store_name]
+        legacy = _legacy_references(columns)
+
+        scanned = 0
+        orphans = 0
+        reclaimed = 0
+        quarantined = 0
+        started = time.monotonic()
+
+        for batch in _iter_batches(store.backend.iter_objects(), batch_size):
+            scanned += len(batch)
+            # Keys are the last path component, for both sharded and legacy flat objects
+            candidates = {os.path.basename(name): (name, size) for name, size, mtime in batch if mtime < cutoff}
+            if not candidates:
+                continue
+
+            referenced = _referenced(columns, set(candidates))
+            for key, (name, size) in candidates.items():
+                if key in referenced or key in legacy:
+                    continue
+
+                orphans += 1
+                reclaimed += _remove_derivatives(store_name, key, dry_run)
+                if delete:
+                    reclaimed += size
+                    if not dry_run:
+                        store.backend.delete(name)
+                else:
+                    quarantined += size
+                    if not dry_run:
+                        store.backend.quarantine(name)
+
+        if purge_quarantine:
+            # Quarantined objects are stamped with the quarantine time, so the grace period starts there
+            for name, size, mtime in store.backend.iter_objects(QUARANTINE_PREFIX):
+                if mtime < cutoff:
+                    reclaimed += size
+                    if not dry_run:
+                        store.backend.delete(name)
+
+        staged, staged_bytes = _clean_staging(store, cutoff, dry_run)
+        reclaimed += staged_bytes
+        total_reclaimed += reclaimed
+
+        elapsed = time.monotonic() - started
+        click.echo(
+            f"{store_name}: scanned {scanned} objects in {elapsed:.1f}s, {action} {orphans} orphans "
+            f"and {staged} stale staging files, {reclaimed / (1024 * 1024):.1f} MB reclaimed, "
+            f"{quarantined / (1024 * 1024):.1f} MB moved to quarantine"
+        )
+
+    # Markers left by workers that stopped before their overlay write landed
+    stale = PendingArtifact.query.filter(PendingArtifact.created_at < datetime.utcfromtimestamp(cutoff))
+    if dry_run:
+        markers = stale.count()
+    else:
+        markers = stale.delete(synchronize_session=False)
+        db.session.commit()
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {markers} stale pending-artifact markers")
+
+    click.echo(f"Total reclaimed: {total_reclaimed / (1024 * 1024):.1f} MB")
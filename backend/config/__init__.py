@@ -1,4 +1,5 @@
 from .database import db, init_app as init_db
 from .token import init_jwt, jwt
+from .replica import read_replica, write_position, POSITION_HEADER
 
-__all__ = ["db", "init_db", "init_jwt", "jwt"]
+__all__ = ["db", "init_db", "init_jwt", "jwt", "read_replica", "write_position", "POSITION_HEADER"]
@@ -3,17 +3,53 @@ from flask_migrate import Migrate
 from dotenv import load_dotenv
 import os
 
-db = SQLAlchemy()
+from flask import current_app, has_request_context
+from sqlalchemy import event
+
+from .replica import RoutingSession, REPLICA_BIND, init_app as init_replica
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 load_dotenv()
 
+def engine_options(uri):
+    """Pool and timeout settings from the environment, shared by the primary and the replica"""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
+    if uri and uri.startswith('postgresql'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    return options
+
+@event.listens_for(RoutingSession, 'after_begin')
+def _limit_request_statements(session, transaction, connection):
+    # Only request handling is capped; migrations and CLI commands (index builds,
+    # backfills, analytics-refresh, storage-gc) run without a statement timeout
+    if not has_request_context() or connection.dialect.name != 'postgresql':
+        return
+    timeout = current_app.config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if timeout > 0:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
 def init_app(app):
     # Configure database connection
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv('DATABASE_URL')
-    # Or use environment variables (recommended for production)
-    # app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Server-side cap per statement in request transactions, so a runaway query cannot hold a connection
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    # Optional streaming replica for read-heavy views, see config/replica.py
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config["SQLALCHEMY_BINDS"] = {
+            REPLICA_BIND: {'url': replica_url, **engine_options(replica_url)}
+        }
 
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+    init_replica(app, db)
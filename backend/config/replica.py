@@ -0,0 +1,100 @@
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+# WAL position of the client's last write; returned after commits and sent back on later reads
+POSITION_HEADER = 'X-DB-Position'
+
+def read_replica(fn):
+    """Serve this view's reads from the replica when it has caught up with the client"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+def _lsn(position):
+    """Convert a PostgreSQL LSN such as '16/B374D848' into an integer"""
+    high, low = position.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+class RoutingSession(Session):
+    """Session that sends reads from @read_replica views to the replica bind.
+
+    Writes, flushes and every other view use the primary. The replica is only
+    used once it has replayed the position in the request's X-DB-Position
+    header, so a client always sees its own uploads; when it lags or cannot be
+    reached the primary serves the read.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+            and has_request_context()
+            and g.get('db_read_replica')
+            and _replica_ready(self._db)
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _replica_ready(db):
+    """Check once per request whether the replica may serve this client's reads"""
+    ready = g.get('db_replica_ready')
+    if ready is not None:
+        return ready
+
+    ready = False
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is not None:
+        try:
+            with engine.connect() as connection:
+                replayed = connection.execute(text('SELECT pg_last_wal_replay_lsn()')).scalar()
+            position = request.headers.get(POSITION_HEADER)
+            # NULL means the bind is not a standby, so it is never behind
+            ready = replayed is None or not position or _lsn(replayed) >= _lsn(position)
+        except (SQLAlchemyError, ValueError):
+            ready = False
+
+    g.db_replica_ready = ready
+    return ready
+
+def write_position():
+    """Primary WAL position after this request's commits, or None if it made none.
+
+    Streaming responses that commit after their headers were sent report it in
+    their body instead of the X-DB-Position header.
+    """
+    if not g.get('db_committed'):
+        return None
+    db = current_app.extensions['sqlalchemy']
+    try:
+        with db.engine.connect() as connection:
+            return str(connection.execute(text('SELECT pg_current_wal_lsn()')).scalar())
+    except SQLAlchemyError as e:
+        current_app.logger.warning(f"Could not read WAL position: {str(e)}")
+        return None
+
+def init_app(app, db):
+    """Tag responses to committed writes with the primary's WAL position"""
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @event.listens_for(RoutingSession, 'after_commit')
+    def mark_write(session):
+        if has_request_context():
+            g.db_committed = True
+
+    @app.after_request
+    def add_position(response):
+        position = write_position()
+        if position:
+            response.headers[POSITION_HEADER] = position
+        return response
@@ -0,0 +1,14 @@
+import os
+import shutil
+
+# Shared directory where each worker writes its metric files; /metrics merges them
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/canine-prometheus')
+
+def on_starting(server):
+    # Drop files left behind by a previous run so counters start from zero
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,257 @@
+"""End-to-end load test against a local app instance with a fake model backend.
+
+Run from the backend directory:
+
+    python -m loadtest.run --rate 5 --duration 60
+    python -m loadtest.run --rate 20 --mix analyze=1,history=4,detection=4 --fake-latency-ms 300
+    python -m loadtest.run --target http://10.0.0.5:8000 --username load --password secret
+
+Without --target the app is started in-process on a local SQLite database with
+MODEL_BACKEND=fake, so no weights are loaded and nothing is downloaded.
+Requests are issued open-loop at the target rate, and latency is measured from
+each request's scheduled start so client-side queueing is not hidden.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+LOADTEST_USER = 'loadtest'
+LOADTEST_PASSWORD = 'loadtest-password'
+
+def start_local_server(args, workdir):
+    """Start the app in a background thread and return its base URL"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'loadtest.db')
+    os.environ['MODEL_BACKEND'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.fake_latency_ms)
+    os.environ['FAKE_MODEL_LATENCY_JITTER_MS'] = str(args.fake_latency_jitter_ms)
+    os.environ['FAKE_MODEL_PER_IMAGE_MS'] = str(args.fake_per_image_ms)
+    os.environ['FAKE_MODEL_MISSING_KEYPOINT_RATE'] = str(args.fake_missing_keypoint_rate)
+    os.environ['FAKE_MODEL_EMPTY_RATE'] = str(args.fake_empty_rate)
+    os.environ.setdefault('JWT_SECRET_KEY', uuid.uuid4().hex)
+
+    from werkzeug.serving import make_server
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from config import db
+    from models import User
+    from services import upload_store, result_store
+
+    # Keep load-test artifacts out of the real uploads/ and results/ folders
+    upload_store.configure(os.path.join(workdir, 'uploads'))
+    result_store.configure(os.path.join(workdir, 'results'))
+
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username=LOADTEST_USER).first():
+            db.session.add(User(
+                username=LOADTEST_USER,
+                email='loadtest@example.com',
+                password=generate_password_hash(LOADTEST_PASSWORD, method='pbkdf2:sha256')
+            ))
+            db.session.commit()
+
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+class Client:
+    """Minimal HTTP client on http.client so the harness has no extra dependencies"""
+
+    def __init__(self, base_url, timeout):
+        parsed = urlparse(base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, body=None, headers=None):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(self.host, self.port, timeout=self.timeout)
+        headers = dict(headers or {})
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def login(self, username, password):
+        status, body = self.request(
+            'POST', '/login',
+            body=json.dumps({'username': username, 'password': password}),
+            headers={'Content-Type': 'application/json'}
+        )
+        if status != 200:
+            raise RuntimeError(f"Login failed with status {status}: {body[:200]!r}")
+        self.token = json.loads(body)['token']
+
+    def analyze(self, image_bytes):
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            f'--{boundary}\r\n'.encode(),
+            b'Content-Disposition: form-data; name="image"; filename="loadtest.jpg"\r\n',
+            b'Content-Type: image/jpeg\r\n\r\n',
+            image_bytes,
+            f'\r\n--{boundary}--\r\n'.encode()
+        ])
+        return self.request('POST', '/analyze', body=body,
+                            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('analyze', 'history', 'detection'):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_load(client, images, args):
+    detection_ids = []
+    ids_lock = threading.Lock()
+    samples = {name: [] for name in args.mix}
+    samples_lock = threading.Lock()
+
+    # Seed a few detections so /detection has something to fetch
+    for image_bytes in images[:max(1, args.seed_analyses)]:
+        status, body = client.analyze(image_bytes)
+        if status == 200:
+            detection_ids.append(json.loads(body)['detection']['detection_id'])
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    rng = random.Random(args.seed)
+
+    def issue(name, scheduled_at):
+        error = None
+        try:
+            if name == 'analyze':
+                status, body = client.analyze(rng.choice(images))
+                if status == 200:
+                    with ids_lock:
+                        detection_ids.append(json.loads(body)['detection']['detection_id'])
+            elif name == 'history':
+                status, _ = client.request('GET', '/history')
+            else:
+                with ids_lock:
+                    detection_id = rng.choice(detection_ids) if detection_ids else 'missing'
+                status, _ = client.request('GET', f'/detection/{detection_id}')
+            if status >= 400:
+                error = f'HTTP {status}'
+        except Exception as e:
+            error = type(e).__name__
+
+        latency = time.monotonic() - scheduled_at
+        with samples_lock:
+            samples[name].append((latency, error))
+
+    total = int(args.rate * args.duration)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(total):
+            scheduled_at = started + i / args.rate
+            delay = scheduled_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(issue, rng.choices(names, weights)[0], scheduled_at)
+    elapsed = time.monotonic() - started
+
+    return samples, elapsed
+
+def report(samples, elapsed):
+    rows = {}
+    for name, entries in samples.items():
+        latencies = sorted(latency * 1000 for latency, _ in entries)
+        errors = sum(1 for _, error in entries if error)
+        rows[name] = {
+            "requests": len(entries),
+            "throughput_rps": len(entries) / elapsed if elapsed else 0.0,
+            "error_rate": errors / len(entries) if entries else 0.0,
+            "p50_ms": percentile(latencies, 0.50),
+            "p90_ms": percentile(latencies, 0.90),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": latencies[-1] if latencies else 0.0,
+            "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+            "errors": sorted({error for _, error in entries if error})
+        }
+
+    print(f"{'endpoint':<10} {'reqs':>6} {'rps':>8} {'err%':>6} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, row in rows.items():
+        print(f"{name:<10} {row['requests']:>6} {row['throughput_rps']:>8.2f} {row['error_rate'] * 100:>6.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+              f"{row['max_ms']:>9.1f}")
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=5.0, help='Target requests per second across all endpoints')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to generate load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('analyze=1,history=2,detection=2'))
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--images', type=int, default=8, help='Distinct synthetic images to upload')
+    parser.add_argument('--image-size', default='2800x1400', help='Synthetic image size, WIDTHxHEIGHT')
+    parser.add_argument('--seed-analyses', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', help='Base URL of a running server instead of starting one')
+    parser.add_argument('--username', default=LOADTEST_USER)
+    parser.add_argument('--password', default=LOADTEST_PASSWORD)
+    parser.add_argument('--port', type=int, default=0, help='Port for the local server (default: any free port)')
+    parser.add_argument('--fake-latency-ms', type=float, default=150.0)
+    parser.add_argument('--fake-latency-jitter-ms', type=float, default=30.0)
+    parser.add_argument('--fake-per-image-ms', type=float, default=0.0)
+    parser.add_argument('--fake-missing-keypoint-rate', type=float, default=0.05)
+    parser.add_argument('--fake-empty-rate', type=float, default=0.0)
+    parser.add_argument('--json', dest='json_path', help='Also write the report to this file')
+    args = parser.parse_args(argv)
+
+    from services.fake_model import synthetic_radiograph
+
+    width, _, height = args.image_size.partition('x')
+    images = [synthetic_radiograph(int(width), int(height), seed=i) for i in range(args.images)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        if args.target:
+            base_url = args.target
+        else:
+            server, base_url = start_local_server(args, workdir)
+
+        try:
+            client = Client(base_url, args.timeout)
+            client.login(args.username, args.password)
+            print(f"Driving {base_url} at {args.rate} req/s for {args.duration}s, mix {args.mix}")
+            samples, elapsed = run_load(client, images, args)
+            rows = report(samples, elapsed)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"rate": args.rate, "duration": elapsed, "endpoints": rows}, f, indent=2)
+
+    return 1 if any(row['error_rate'] > 0 for row in rows.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Add (user_id, created_at DESC, id DESC) index for keyset-paginated history
+
+Revision ID: 3c9f1e7a5b21
+Revises: 074d0d6a0cb0
+Create Date: 2026-10-19 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9f1e7a5b21'
+down_revision = '074d0d6a0cb0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so existing history reads and new detections are not blocked
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_keypoint_detections_user_id_created_at',
+            'keypoint_detections',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_keypoint_detections_user_id_created_at',
+            table_name='keypoint_detections',
+            postgresql_concurrently=True
+        )
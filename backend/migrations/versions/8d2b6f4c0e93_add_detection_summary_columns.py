@@ -0,0 +1,89 @@
+"""Add analysis summary columns to keypoint_detections and backfill them
+
+Revision ID: 8d2b6f4c0e93
+Revises: 3c9f1e7a5b21
+Create Date: 2026-10-19 10:02:17.540931
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2b6f4c0e93'
+down_revision = '3c9f1e7a5b21'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _summary(analysis_json):
+    try:
+        analysis = json.loads(analysis_json) if analysis_json else {}
+    except ValueError:
+        analysis = {}
+    sector_analysis = analysis.get('sector_analysis') or {}
+    confidence = analysis.get('confidence') or {}
+    sector = sector_analysis.get('sector')
+    return {
+        'side': analysis.get('side'),
+        'sector': sector if isinstance(sector, int) else None,
+        'impaction_type': sector_analysis.get('impaction_type'),
+        'difficult_factors': analysis.get('difficult_factors'),
+        'keypoint_coverage': confidence.get('coverage_ratio')
+    }
+
+
+def upgrade():
+    with op.batch_alter_table('keypoint_detections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('side', sa.String(length=10), nullable=True))
+        batch_op.add_column(sa.Column('sector', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('impaction_type', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('difficult_factors', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('keypoint_coverage', sa.Float(), nullable=True))
+
+    # Backfill in id order, one batch per statement, so the table is never read in one go
+    connection = op.get_bind()
+    detections = sa.table(
+        'keypoint_detections',
+        sa.column('id', sa.String),
+        sa.column('analysis_json', sa.Text),
+        sa.column('side', sa.String),
+        sa.column('sector', sa.Integer),
+        sa.column('impaction_type', sa.String),
+        sa.column('difficult_factors', sa.Integer),
+        sa.column('keypoint_coverage', sa.Float)
+    )
+    update = detections.update().where(detections.c.id == sa.bindparam('detection_id')).values(
+        side=sa.bindparam('side'),
+        sector=sa.bindparam('sector'),
+        impaction_type=sa.bindparam('impaction_type'),
+        difficult_factors=sa.bindparam('difficult_factors'),
+        keypoint_coverage=sa.bindparam('keypoint_coverage')
+    )
+
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            sa.select(detections.c.id, detections.c.analysis_json)
+            .where(detections.c.id > last_id)
+            .order_by(detections.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.execute(update, [{'detection_id': row.id, **_summary(row.analysis_json)} for row in rows])
+        last_id = rows[-1].id
+
+
+def downgrade():
+    with op.batch_alter_table('keypoint_detections', schema=None) as batch_op:
+        batch_op.drop_column('keypoint_coverage')
+        batch_op.drop_column('difficult_factors')
+        batch_op.drop_column('impaction_type')
+        batch_op.drop_column('sector')
+        batch_op.drop_column('side')
@@ -0,0 +1,28 @@
+"""Add pending_artifacts for overlays committed before their write lands
+
+Revision ID: a3d6f0b9c512
+Revises: f4b2e8d1c937
+Create Date: 2026-10-19 16:10:27.903614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d6f0b9c512'
+down_revision = 'f4b2e8d1c937'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pending_artifacts',
+    sa.Column('key', sa.String(length=80), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('pending_artifacts')
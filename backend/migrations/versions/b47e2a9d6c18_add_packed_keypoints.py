@@ -0,0 +1,41 @@
+"""Add packed keypoint array to keypoint_detections and index keypoints.detection_id
+
+Revision ID: b47e2a9d6c18
+Revises: 8d2b6f4c0e93
+Create Date: 2026-10-19 10:41:05.913377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b47e2a9d6c18'
+down_revision = '8d2b6f4c0e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('keypoint_detections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('keypoints_packed', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('keypoints_version', sa.String(length=16), nullable=True))
+
+    # Existing detections keep being read from the keypoints table, now through this index
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_keypoints_detection_id',
+            'keypoints',
+            ['detection_id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_keypoints_detection_id', table_name='keypoints', postgresql_concurrently=True)
+
+    with op.batch_alter_table('keypoint_detections', schema=None) as batch_op:
+        batch_op.drop_column('keypoints_version')
+        batch_op.drop_column('keypoints_packed')
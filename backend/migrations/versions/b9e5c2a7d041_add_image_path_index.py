@@ -0,0 +1,37 @@
+"""Add (user_id, image_path) index so ingest can skip images it already imported
+
+Revision ID: b9e5c2a7d041
+Revises: a3d6f0b9c512
+Create Date: 2026-10-19 18:02:51.447160
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e5c2a7d041'
+down_revision = 'a3d6f0b9c512'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so uploads are not blocked while it builds
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_keypoint_detections_user_id_image_path',
+            'keypoint_detections',
+            ['user_id', 'image_path'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_keypoint_detections_user_id_image_path',
+            table_name='keypoint_detections',
+            postgresql_concurrently=True
+        )
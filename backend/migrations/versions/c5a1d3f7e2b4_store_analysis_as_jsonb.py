@@ -0,0 +1,105 @@
+"""Store detection analysis as JSONB with search indexes
+
+Revision ID: c5a1d3f7e2b4
+Revises: b47e2a9d6c18
+Create Date: 2026-10-19 11:20:36.174802
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a1d3f7e2b4'
+down_revision = 'b47e2a9d6c18'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Must match models.keypoint.analysis_angle
+ANGLES = ('angle_with_midline', 'angle_with_lateral', 'angle_with_occlusal')
+
+
+def _copy_in_batches(connection, source, target, convert, value_sql=':value'):
+    """Copy one column into another in id order, committing each batch on its own"""
+    detections = sa.table(
+        'keypoint_detections',
+        sa.column('id', sa.String),
+        sa.column(source),
+        sa.column(target)
+    )
+    update = sa.text(
+        f"UPDATE keypoint_detections SET {target} = {value_sql} WHERE id = :detection_id"
+    )
+
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            sa.select(detections.c.id, detections.c[source])
+            .where(detections.c.id > last_id)
+            .where(detections.c[source].isnot(None))
+            .order_by(detections.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.execute(update, [{'detection_id': row[0], 'value': convert(row[1])} for row in rows])
+        last_id = rows[-1][0]
+
+
+def _to_jsonb(text):
+    # jsonb rejects NaN and Infinity, which json.dumps may have written
+    try:
+        value = json.loads(text, parse_constant=lambda constant: None)
+    except ValueError:
+        return None
+    return json.dumps(value)
+
+
+def upgrade():
+    op.add_column('keypoint_detections', sa.Column('analysis', postgresql.JSONB(), nullable=True))
+
+    # Batches commit independently so the table is never locked for the whole conversion
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        _copy_in_batches(connection, 'analysis_json', 'analysis', _to_jsonb, 'CAST(:value AS jsonb)')
+
+        op.create_index(
+            'ix_keypoint_detections_analysis',
+            'keypoint_detections',
+            ['analysis'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'analysis': 'jsonb_path_ops'},
+            postgresql_concurrently=True
+        )
+        for angle in ANGLES:
+            op.create_index(
+                f'ix_keypoint_detections_{angle}',
+                'keypoint_detections',
+                [sa.text(f"((analysis #>> '{{angle_measurements,{angle},value}}')::float)")],
+                unique=False,
+                postgresql_concurrently=True
+            )
+
+    # analysis_json stays until f4b2e8d1c937, so app servers still running the
+    # previous release keep working while this one rolls out
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        _copy_in_batches(connection, 'analysis', 'analysis_json', json.dumps)
+
+        for angle in ANGLES:
+            op.drop_index(f'ix_keypoint_detections_{angle}', table_name='keypoint_detections',
+                          postgresql_concurrently=True)
+        op.drop_index('ix_keypoint_detections_analysis', table_name='keypoint_detections',
+                      postgresql_concurrently=True)
+
+    op.drop_column('keypoint_detections', 'analysis')
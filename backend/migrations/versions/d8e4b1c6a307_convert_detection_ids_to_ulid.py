@@ -0,0 +1,70 @@
+"""Convert millisecond timestamp detection IDs to ULIDs
+
+Revision ID: d8e4b1c6a307
+Revises: c5a1d3f7e2b4
+Create Date: 2026-10-19 11:58:12.602947
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e4b1c6a307'
+down_revision = 'c5a1d3f7e2b4'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Same encoding as utils.ids, copied so the migration does not depend on app code
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def _ulid(timestamp_ms):
+    value = (timestamp_ms << 80) | int.from_bytes(os.urandom(10), 'big')
+    chars = []
+    for _ in range(26):
+        chars.append(ALPHABET[value & 0x1f])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # Keypoints are re-pointed in the same transaction, so the constraint is lifted meanwhile
+    op.drop_constraint('keypoints_detection_id_fkey', 'keypoints', type_='foreignkey')
+
+    # Legacy IDs are str(int(time.time() * 1000)); the ULID keeps that timestamp
+    last_id = ''
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT id FROM keypoint_detections WHERE id > :last_id AND id ~ '^[0-9]+$' "
+            "ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        mapping = [{'old_id': row[0], 'new_id': _ulid(int(row[0]))} for row in rows]
+        connection.execute(
+            sa.text("UPDATE keypoints SET detection_id = :new_id WHERE detection_id = :old_id"),
+            mapping
+        )
+        connection.execute(
+            sa.text("UPDATE keypoint_detections SET id = :new_id WHERE id = :old_id"),
+            mapping
+        )
+        last_id = rows[-1][0]
+
+    op.create_foreign_key(
+        'keypoints_detection_id_fkey', 'keypoints', 'keypoint_detections',
+        ['detection_id'], ['id']
+    )
+
+
+def downgrade():
+    # ULIDs fit the existing String(50) column and need no conversion back
+    pass
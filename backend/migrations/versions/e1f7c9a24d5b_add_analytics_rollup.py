@@ -0,0 +1,47 @@
+"""Add detection_daily_stats rollup and analytics_refresh high-water marks
+
+Revision ID: e1f7c9a24d5b
+Revises: d8e4b1c6a307
+Create Date: 2026-10-19 13:05:48.227619
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f7c9a24d5b'
+down_revision = 'd8e4b1c6a307'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('detection_daily_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('prediction_result', sa.String(length=50), nullable=True),
+    sa.Column('sector', sa.Integer(), nullable=True),
+    sa.Column('impaction_type', sa.String(length=50), nullable=True),
+    sa.Column('confidence_bucket', sa.Integer(), nullable=True),
+    sa.Column('detections', sa.Integer(), nullable=False),
+    sa.Column('confidence_sum', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_detection_daily_stats_day', 'detection_daily_stats', ['day'], unique=False)
+    op.create_index('ix_detection_daily_stats_user_id_day', 'detection_daily_stats', ['user_id', 'day'], unique=False)
+
+    op.create_table('analytics_refresh',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('refreshed_through', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # The rollup is filled by the first `flask analytics-refresh`
+
+
+def downgrade():
+    op.drop_table('analytics_refresh')
+    op.drop_index('ix_detection_daily_stats_user_id_day', table_name='detection_daily_stats')
+    op.drop_index('ix_detection_daily_stats_day', table_name='detection_daily_stats')
+    op.drop_table('detection_daily_stats')
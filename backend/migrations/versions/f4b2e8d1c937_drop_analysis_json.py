@@ -0,0 +1,70 @@
+"""Drop the analysis_json text column replaced by analysis
+
+Revision ID: f4b2e8d1c937
+Revises: e1f7c9a24d5b
+Create Date: 2026-10-19 15:42:09.518330
+
+Upgrade to e1f7c9a24d5b and finish rolling out the application before
+applying this one: rows that the previous release wrote only to
+analysis_json in the meantime are copied over just before the drop.
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b2e8d1c937'
+down_revision = 'e1f7c9a24d5b'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _to_jsonb(text):
+    # jsonb rejects NaN and Infinity, which json.dumps may have written
+    try:
+        value = json.loads(text, parse_constant=lambda constant: None)
+    except ValueError:
+        return None
+    return json.dumps(value)
+
+
+def upgrade():
+    detections = sa.table(
+        'keypoint_detections',
+        sa.column('id', sa.String),
+        sa.column('analysis_json', sa.Text),
+        sa.column('analysis')
+    )
+    update = sa.text(
+        "UPDATE keypoint_detections SET analysis = CAST(:value AS jsonb) "
+        "WHERE id = :detection_id AND analysis IS NULL"
+    )
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = ''
+        while True:
+            rows = connection.execute(
+                sa.select(detections.c.id, detections.c.analysis_json)
+                .where(detections.c.id > last_id)
+                .where(detections.c.analysis.is_(None))
+                .where(detections.c.analysis_json.isnot(None))
+                .order_by(detections.c.id)
+                .limit(BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+
+            connection.execute(update, [{'detection_id': row[0], 'value': _to_jsonb(row[1])} for row in rows])
+            last_id = rows[-1][0]
+
+    op.drop_column('keypoint_detections', 'analysis_json')
+
+
+def downgrade():
+    # c5a1d3f7e2b4's downgrade copies analysis back into this column
+    op.add_column('keypoint_detections', sa.Column('analysis_json', sa.Text(), nullable=True))
@@ -1,4 +1,6 @@
 from .user import User
 from .keypoint import KeypointDetection, Keypoint
+from .analytics import DetectionDailyStats, AnalyticsRefresh
+from .artifact import PendingArtifact
 
-__all__ = ['User', 'KeypointDetection', 'Keypoint']
+__all__ = ['User', 'KeypointDetection', 'Keypoint', 'DetectionDailyStats', 'AnalyticsRefresh', 'PendingArtifact']
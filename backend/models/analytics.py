@@ -0,0 +1,31 @@
+from config import db
+
+class DetectionDailyStats(db.Model):
+    """Detection counts per day and dimension combination, maintained by `flask analytics-refresh`"""
+    __tablename__ = 'detection_daily_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    prediction_result = db.Column(db.String(50), nullable=True)
+    sector = db.Column(db.Integer, nullable=True)
+    impaction_type = db.Column(db.String(50), nullable=True)
+    confidence_bucket = db.Column(db.Integer, nullable=True)  # floor(confidence * 10), 0-9
+    detections = db.Column(db.Integer, nullable=False)
+    confidence_sum = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f'<DetectionDailyStats {self.day} user={self.user_id} n={self.detections}>'
+
+db.Index('ix_detection_daily_stats_day', DetectionDailyStats.day)
+db.Index('ix_detection_daily_stats_user_id_day', DetectionDailyStats.user_id, DetectionDailyStats.day)
+
+class AnalyticsRefresh(db.Model):
+    """High-water mark of each rollup, so refreshes only recompute recent days"""
+    __tablename__ = 'analytics_refresh'
+
+    name = db.Column(db.String(50), primary_key=True)
+    refreshed_through = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalyticsRefresh {self.name} {self.refreshed_through}>'
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from config import db
+
+class PendingArtifact(db.Model):
+    """Overlay key committed on a detection while its background write is still running.
+
+    Removed once the write lands, so a worker that does not find the file can
+    tell "not written yet" from "does not exist".
+    """
+    __tablename__ = 'pending_artifacts'
+
+    key = db.Column(db.String(80), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PendingArtifact {self.key}>'
@@ -1,25 +1,68 @@
 from config import db
 from datetime import datetime
-import json
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Angle measurements with an expression index; the SQL must match the index definition
+ANALYSIS_ANGLES = ('angle_with_midline', 'angle_with_lateral', 'angle_with_occlusal')
+
+def analysis_angle(name):
+    """SQL expression for an angle value in the analysis document, as indexed"""
+    if name not in ANALYSIS_ANGLES:
+        raise ValueError(f"Unknown angle: {name}")
+    return db.literal_column(f"((keypoint_detections.analysis #>> '{{angle_measurements,{name},value}}')::float)")
 
 class KeypointDetection(db.Model):
     __tablename__ = 'keypoint_detections'
 
-    id = db.Column(db.String(50), primary_key=True)  # Changed to String for timestamp-based IDs
+    id = db.Column(db.String(50), primary_key=True)  # ULID, see utils/ids.py
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     image_path = db.Column(db.String(255), nullable=False)
     result_path = db.Column(db.String(255), nullable=True)
     confidence_score = db.Column(db.Float, nullable=True)
     prediction_result = db.Column(db.String(50), nullable=True)
-    analysis_json = db.Column(db.Text, nullable=True)  # Added field for storing analysis results as JSON
+    analysis = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=True)  # Analysis results, JSONB on PostgreSQL
     keypoints = db.relationship('Keypoint', backref='detection', lazy=True, cascade="all, delete-orphan")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     segmentation_path = db.Column(db.String(255), nullable=True)
 
+    # Summary of the analysis kept as plain columns so history lists never parse the full analysis
+    side = db.Column(db.String(10), nullable=True)
+    sector = db.Column(db.Integer, nullable=True)
+    impaction_type = db.Column(db.String(50), nullable=True)
+    difficult_factors = db.Column(db.Integer, nullable=True)
+    keypoint_coverage = db.Column(db.Float, nullable=True)
+
+    # Keypoints as one float32 (x, y, confidence) array in label map order; see utils/keypoints.py
+    keypoints_packed = db.Column(db.LargeBinary, nullable=True)
+    keypoints_version = db.Column(db.String(16), nullable=True)
+
     def __repr__(self):
         return f'<KeypointDetection {self.id}>'
 
-    def to_dict(self):
+    @staticmethod
+    def summary_from_analysis(analysis, side=None):
+        """Return the summary column values for an analysis dict"""
+        sector_analysis = analysis.get('sector_analysis') or {}
+        confidence = analysis.get('confidence') or {}
+        return {
+            'side': side or analysis.get('side'),
+            'sector': sector_analysis.get('sector'),
+            'impaction_type': sector_analysis.get('impaction_type'),
+            'difficult_factors': analysis.get('difficult_factors'),
+            'keypoint_coverage': confidence.get('coverage_ratio')
+        }
+
+    def summary_dict(self):
+        """Fields shown in history lists; does not load the analysis document"""
+        return {
+            'side': self.side,
+            'sector': self.sector,
+            'impaction_type': self.impaction_type,
+            'difficult_factors': self.difficult_factors,
+            'keypoint_coverage': self.keypoint_coverage
+        }
+
+    def to_dict(self, include_keypoints=True):
         result = {
             'id': self.id,
             'user_id': self.user_id,
@@ -27,27 +70,50 @@ class KeypointDetection(db.Model):
             'result_path': self.result_path,
             'confidence_score': self.confidence_score,
             'prediction_result': self.prediction_result,
-            'keypoints': [keypoint.to_dict() for keypoint in self.keypoints],
             'created_at': self.created_at.isoformat()
         }
 
+        if include_keypoints:
+            result['keypoints'] = [keypoint.to_dict() for keypoint in self.keypoints]
+
         if self.segmentation_path:
             result['segmentation_path'] = self.segmentation_path
 
         # Add analysis if available
-        if hasattr(self, 'analysis_json') and self.analysis_json:
-            try:
-                result['analysis'] = json.loads(self.analysis_json)
-            except:
-                result['analysis'] = None
+        if self.analysis is not None:
+            result['analysis'] = self.analysis
 
         return result
 
+# Serves keyset-paginated history: WHERE user_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+db.Index(
+    'ix_keypoint_detections_user_id_created_at',
+    KeypointDetection.user_id,
+    KeypointDetection.created_at.desc(),
+    KeypointDetection.id.desc()
+)
+
+# Ingest skips images whose content key the owner already has a detection for
+db.Index(
+    'ix_keypoint_detections_user_id_image_path',
+    KeypointDetection.user_id,
+    KeypointDetection.image_path
+)
+
+# Cohort search containment queries (analysis @> '{...}'); angle ranges use the
+# expression indexes created in migration c5a1d3f7e2b4
+db.Index(
+    'ix_keypoint_detections_analysis',
+    KeypointDetection.analysis,
+    postgresql_using='gin',
+    postgresql_ops={'analysis': 'jsonb_path_ops'}
+)
+
 class Keypoint(db.Model):
     __tablename__ = 'keypoints'
 
     id = db.Column(db.Integer, primary_key=True)
-    detection_id = db.Column(db.String(50), db.ForeignKey('keypoint_detections.id'), nullable=False)
+    detection_id = db.Column(db.String(50), db.ForeignKey('keypoint_detections.id'), nullable=False, index=True)
     label = db.Column(db.String(50), nullable=False)
     x_coord = db.Column(db.Float, nullable=False)
     y_coord = db.Column(db.Float, nullable=False)
@@ -0,0 +1,74 @@
+from flask import Blueprint, current_app, send_from_directory, jsonify, request
+import os
+import traceback
+from datetime import date, timedelta
+
+from config import read_replica
+from services import analytics_service
+from utils.auth import admin_required
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    folder = current_app.config['PROFILE_FOLDER']
+    profiles = []
+    if os.path.isdir(folder):
+        profiles = sorted(
+            (name[:-len('.speedscope.json')] for name in os.listdir(folder) if name.endswith('.speedscope.json')),
+            reverse=True
+        )
+
+    return jsonify({
+        'status': 'success',
+        'profiles': profiles
+    })
+
+@admin_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    return send_from_directory(
+        current_app.config['PROFILE_FOLDER'],
+        f"{profile_id}.speedscope.json",
+        mimetype='application/json',
+        as_attachment=True
+    )
+
+@admin_bp.route('/admin/analytics', methods=['GET'])
+@admin_required
+@read_replica
+def get_analytics():
+    # Day range, inclusive; defaults to the last ANALYTICS_DEFAULT_DAYS days
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        start = (
+            date.fromisoformat(request.args['from']) if request.args.get('from')
+            else end - timedelta(days=current_app.config.get('ANALYTICS_DEFAULT_DAYS', 30) - 1)
+        )
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid date: {str(e)}'
+        }), 400
+
+    try:
+        analytics = analytics_service.summary(
+            start,
+            end,
+            user_id=request.args.get('user_id', type=int),
+            top=max(1, min(request.args.get('top', 10, type=int), 100))
+        )
+
+        return jsonify({
+            'status': 'success',
+            'analytics': analytics
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error computing analytics: {str(e)}")
+        current_app.logger.error(traceback.format_exc())
+        return jsonify({
+            'status': 'error',
+            'message': f'Error computing analytics: {str(e)}'
+        }), 500
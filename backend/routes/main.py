@@ -1,4 +1,7 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, Response
+
+from services import inference_scheduler
+from utils.metrics import render
 
 main_bp = Blueprint('main', __name__)
 
@@ -13,5 +16,11 @@ def index():
 def health_check():
     return jsonify({
         'status': 'ok',
-        'message': 'Service is running'
+        'message': 'Service is running',
+        'inference': inference_scheduler.stats()
     })
+
+@main_bp.route('/metrics')
+def metrics():
+    body, content_type = render()
+    return Response(body, content_type=content_type)
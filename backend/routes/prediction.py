@@ -1,10 +1,24 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, current_app, send_file, abort, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
 import os
+import json
+import shutil
+import tempfile
 import traceback
-from PIL import Image
-
-from services import keypoint_service, segmentation_service
+import zipfile
+from datetime import datetime
+
+from services import (
+    keypoint_service, segmentation_service, upload_store, result_store, derivative_service, artifact_writer, BULK
+)
+from services.storage import KEY_PATTERN
+from config import read_replica, write_position
+from models.keypoint import ANALYSIS_ANGLES
+from utils.auth import current_user_is_admin
+from utils.metrics import stage
+from utils.uploads import ACCEPTED_FORMATS, CappedFile, inspect_image, stream_size
 
 prediction_bp = Blueprint('prediction', __name__)
 
@@ -13,6 +27,23 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def validate_image(file):
+    """Return an error message if the file is not a usable image, otherwise None"""
+    try:
+        # Type and dimensions come from the header; the pixels are decoded once, by the model
+        image_format, width, height = inspect_image(file)
+    except Exception as e:
+        current_app.logger.error(f"Image validation error: {str(e)}")
+        return 'Uploaded file is not a valid image.'
+
+    if image_format not in ACCEPTED_FORMATS:
+        return 'Uploaded file is not a valid image.'
+
+    if width < 200 or height < 200:
+        return 'Image is too small. Minimum dimensions are 200x200 pixels.'
+
+    return None
+
 @prediction_bp.route('/analyze', methods=['POST'])
 @jwt_required()
 def analyze_image():
@@ -36,40 +67,29 @@ def analyze_image():
 
     if file and allowed_file(file.filename):
         try:
-            # Check file size
-            file_content = file.read()
-            file.seek(0)  # Reset file pointer to beginning after reading
+            # Check file size; the part is already spooled, so this never reads it
+            with stage('upload_read'):
+                file_size = stream_size(file.stream)
 
             # Check if file is too large (e.g., > 10MB)
-            if len(file_content) > 10 * 1024 * 1024:
+            if file_size > current_app.config.get('MAX_IMAGE_SIZE', 10 * 1024 * 1024):
                 return jsonify({
                     'status': 'error',
                     'message': 'File is too large. Maximum size is 10MB.'
                 }), 400
 
             # Check if file is valid image
-            try:
-                img = Image.open(file)
-                img.verify()  # Verify it's an image
-                file.seek(0)  # Reset file pointer
-
-                # Check image dimensions
-                img = Image.open(file)
-                if img.width < 200 or img.height < 200:
-                    return jsonify({
-                        'status': 'error',
-                        'message': 'Image is too small. Minimum dimensions are 200x200 pixels.'
-                    }), 400
-                file.seek(0)  # Reset file pointer again
-            except Exception as e:
-                current_app.logger.error(f"Image validation error: {str(e)}")
+            with stage('decode'):
+                validation_error = validate_image(file.stream)
+            if validation_error:
                 return jsonify({
                     'status': 'error',
-                    'message': 'Uploaded file is not a valid image.'
+                    'message': validation_error
                 }), 400
 
-            # Save the uploaded image
-            image_path = keypoint_service.save_image(file)
+            # Save the uploaded image, hashing it while it is copied into the store
+            with stage('upload_write'):
+                image_path = keypoint_service.save_image(file)
 
             # First, get segmentation results
             segmentation_results = segmentation_service.get_tooth_segmentation(image_path)
@@ -116,8 +136,264 @@ def analyze_image():
         'message': 'Invalid file format. Allowed formats: png, jpg, jpeg'
     }), 400
 
+@prediction_bp.route('/analyze/batch', methods=['POST'])
+@jwt_required()
+def analyze_batch():
+    """Analyze a series of images and stream one NDJSON line per image.
+
+    Accepts any number of multipart file parts (``images``) and/or zip archives
+    (``archive`` or any part ending in ``.zip``). Parts are spooled straight to
+    disk while the body is parsed, then fed through the pipeline in batches.
+    """
+    user_id = get_jwt_identity()
+    staging_dir = os.path.join(upload_store.root, '.incoming')
+    os.makedirs(staging_dir, exist_ok=True)
+
+    max_size = current_app.config.get('MAX_IMAGE_SIZE', 10 * 1024 * 1024)
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        # Image parts stop spooling at MAX_IMAGE_SIZE; archives are bounded by the request limit
+        limit = None if (filename or '').lower().endswith('.zip') else max_size
+        fd, path = tempfile.mkstemp(dir=staging_dir, suffix='.part')
+        os.close(fd)
+        return CappedFile(path, limit)
+
+    try:
+        # This endpoint's counterpart of MAX_CONTENT_LENGTH, enforced on chunked bodies as well
+        _, _, files = parse_form_data(
+            request.environ,
+            stream_factory=stream_factory,
+            max_content_length=current_app.config.get('BATCH_MAX_CONTENT_LENGTH')
+        )
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        current_app.logger.error(f"Error receiving batch upload: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Could not read the uploaded files'
+        }), 400
+
+    uploads = [f for f in files.values() if f.filename]
+    if not uploads:
+        return jsonify({
+            'status': 'error',
+            'message': 'No image provided'
+        }), 400
+
+    batch_size = max(1, int(current_app.config.get('ANALYZE_BATCH_SIZE', 8)))
+    max_images = int(current_app.config.get('BATCH_MAX_IMAGES', 200))
+
+    def generate():
+        processed = 0
+        failed = 0
+        pending = []
+
+        try:
+            for index, item in enumerate(_iter_batch_images(uploads, staging_dir, max_images)):
+                item['index'] = index
+                if 'error' in item:
+                    failed += 1
+                    yield _ndjson({
+                        'index': index,
+                        'filename': item['filename'],
+                        'status': 'error',
+                        'message': item['error']
+                    })
+                    continue
+
+                pending.append(item)
+                if len(pending) >= batch_size:
+                    for line, ok in _run_batch(pending, user_id):
+                        processed += ok
+                        failed += not ok
+                        yield line
+                    pending = []
+
+            if pending:
+                for line, ok in _run_batch(pending, user_id):
+                    processed += ok
+                    failed += not ok
+                    yield line
+                pending = []
+
+            summary = {
+                'status': 'complete',
+                'processed': processed,
+                'failed': failed
+            }
+            # Rows were committed after the headers went out, so the read-your-writes position goes here
+            position = write_position()
+            if position:
+                summary['db_position'] = position
+            yield _ndjson(summary)
+        finally:
+            for item in pending:
+                _discard(item.get('path'))
+            for upload in uploads:
+                upload.stream.close()
+                _discard(upload.stream.name)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _ndjson(payload):
+    return json.dumps(payload) + '\n'
+
+def _discard(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def _iter_batch_images(uploads, staging_dir, max_images):
+    """Yield one staged, validated image per upload part or zip member.
+
+    Past max_images entries, members are reported as rejected without being
+    extracted or staged.
+    """
+    max_size = current_app.config.get('MAX_IMAGE_SIZE', 10 * 1024 * 1024)
+    limit_error = f'Batch limit of {max_images} images exceeded'
+    count = 0
+
+    for upload in uploads:
+        if upload.name == 'archive' or upload.filename.lower().endswith('.zip'):
+            upload.stream.flush()
+            if upload.stream.truncated:
+                yield {'filename': upload.filename, 'error': 'Archive is too large'}
+                continue
+            try:
+                archive = zipfile.ZipFile(upload.stream.name)
+            except zipfile.BadZipFile:
+                yield {'filename': upload.filename, 'error': 'Invalid zip archive'}
+                continue
+
+            with archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.'):
+                        continue
+                    count += 1
+                    if count > max_images:
+                        yield {'filename': name, 'error': limit_error}
+                        continue
+                    if not allowed_file(name):
+                        yield {'filename': name, 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'}
+                        continue
+                    if info.file_size > max_size:
+                        yield {'filename': name, 'error': 'File is too large. Maximum size is 10MB.'}
+                        continue
+
+                    # Extract member by member so only one image is unpacked at a time
+                    with archive.open(info) as src, tempfile.NamedTemporaryFile(
+                            dir=staging_dir, suffix='.part', delete=False) as dst:
+                        shutil.copyfileobj(src, dst)
+                    yield _validate_staged(name, dst.name, max_size)
+            continue
+
+        count += 1
+        if count > max_images:
+            # Left in place; the upload cleanup removes the spooled part
+            yield {'filename': upload.filename, 'error': limit_error}
+            continue
+        if not allowed_file(upload.filename):
+            yield {'filename': upload.filename, 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'}
+            continue
+        if upload.stream.truncated:
+            yield {'filename': upload.filename, 'error': 'File is too large. Maximum size is 10MB.'}
+            continue
+
+        # Hand the spooled part over so the upload cleanup does not remove it
+        upload.stream.close()
+        staged_path = upload.stream.name + '.img'
+        os.replace(upload.stream.name, staged_path)
+        yield _validate_staged(upload.filename, staged_path, max_size)
+
+def _validate_staged(filename, path, max_size):
+    if os.path.getsize(path) > max_size:
+        _discard(path)
+        return {'filename': filename, 'error': 'File is too large. Maximum size is 10MB.'}
+
+    with open(path, 'rb') as f, stage('decode'):
+        validation_error = validate_image(f)
+    if validation_error:
+        _discard(path)
+        return {'filename': filename, 'error': validation_error}
+
+    # Stays in the staging directory until its batch runs, so cleanup never touches the store
+    return {'filename': filename, 'path': path}
+
+def _run_batch(items, user_id):
+    """Run segmentation and keypoint detection for a batch, yielding (line, ok) per image"""
+    # Move staged files into the upload store only now; item['path'] keeps the staging path
+    image_paths = [keypoint_service.save_image_from_path(item['path'], move=True) for item in items]
+    for item, image_path in zip(items, image_paths):
+        item['image_path'] = image_path
+
+    try:
+        # Batches queue as bulk work so single /analyze uploads in this worker go ahead of them
+        segmentations = segmentation_service.get_tooth_segmentation_batch(image_paths, priority=BULK)
+    except Exception as e:
+        current_app.logger.error(f"Error in batch segmentation: {str(e)}")
+        for item in items:
+            yield _ndjson({
+                'index': item['index'],
+                'filename': item['filename'],
+                'status': 'error',
+                'message': 'Error processing image. The AI model may have difficulty analyzing this X-ray.'
+            }), False
+        return
+
+    ready = []
+    for item, segmentation in zip(items, segmentations):
+        if segmentation.get('status') == 'error':
+            yield _ndjson({
+                'index': item['index'],
+                'filename': item['filename'],
+                'status': 'error',
+                'message': segmentation['message']
+            }), False
+        else:
+            ready.append((item, segmentation))
+
+    if not ready:
+        return
+
+    # One model call for the batch, but each image is streamed as soon as its row is committed
+    detections = keypoint_service.iter_keypoints_batch(
+        [item['image_path'] for item, _ in ready],
+        user_id,
+        segmentation_batch=[segmentation for _, segmentation in ready],
+        priority=BULK
+    )
+    failure = None
+    for item, segmentation in ready:
+        if failure is None:
+            try:
+                detection = next(detections)
+            except Exception as e:
+                current_app.logger.error(f"Error in batch keypoint detection: {str(e)}")
+                failure = str(e)
+        if failure is not None:
+            detection = {'status': 'error', 'message': failure}
+
+        if detection.get('status') == 'error':
+            yield _ndjson({
+                'index': item['index'],
+                'filename': item['filename'],
+                'status': 'error',
+                'message': detection['message']
+            }), False
+            continue
+
+        yield _ndjson({
+            'index': item['index'],
+            'filename': item['filename'],
+            'status': 'success',
+            'detection': detection,
+            'segmentation': segmentation
+        }), True
+
 @prediction_bp.route('/detection/<detection_id>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_detection(detection_id):
     user_id = get_jwt_identity()
 
@@ -153,18 +429,35 @@ def get_detection(detection_id):
 
 @prediction_bp.route('/history', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_history():
     user_id = get_jwt_identity()
 
+    # Page size is capped so a single call never returns an unbounded history
+    max_page_size = current_app.config.get('HISTORY_MAX_PAGE_SIZE', 200)
+    limit = request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50), type=int)
+    limit = max(1, min(limit, max_page_size))
+
     try:
-        # Get detection history for the user
-        history = keypoint_service.get_user_history(user_id)
+        # Get one page of detection history for the user
+        history, next_cursor = keypoint_service.get_user_history(
+            user_id,
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
 
         return jsonify({
             'status': 'success',
-            'history': history
+            'history': history,
+            'next_cursor': next_cursor
         })
 
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
     except Exception as e:
         current_app.logger.error(f"Error retrieving history: {str(e)}")
         current_app.logger.error(traceback.format_exc())
@@ -173,10 +466,190 @@ def get_history():
             'message': f'Error retrieving history: {str(e)}'
         }), 500
 
+@prediction_bp.route('/detections', methods=['GET'])
+@jwt_required()
+@read_replica
+def get_detections():
+    user_id = get_jwt_identity()
+
+    # Comma separated IDs, e.g. /detections?ids=01J...,01J...
+    detection_ids = [i for i in request.args.get('ids', '').split(',') if i]
+    if not detection_ids:
+        return jsonify({
+            'status': 'error',
+            'message': 'No detection IDs provided'
+        }), 400
+
+    max_ids = current_app.config.get('HISTORY_MAX_PAGE_SIZE', 200)
+    if len(detection_ids) > max_ids:
+        return jsonify({
+            'status': 'error',
+            'message': f'Too many detection IDs. Maximum is {max_ids}.'
+        }), 400
+
+    try:
+        # One query for all of them; other users' detections are simply not returned
+        found = keypoint_service.get_detections_by_ids(detection_ids, user_id=user_id)
+
+        return jsonify({
+            'status': 'success',
+            'detections': [found[i] for i in detection_ids if i in found],
+            'missing': [i for i in detection_ids if i not in found]
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving detections: {str(e)}")
+        current_app.logger.error(traceback.format_exc())
+        return jsonify({
+            'status': 'error',
+            'message': f'Error retrieving detections: {str(e)}'
+        }), 500
+
+@prediction_bp.route('/detections/search', methods=['GET'])
+@jwt_required()
+@read_replica
+def search_detections():
+    user_id = get_jwt_identity()
+
+    max_page_size = current_app.config.get('HISTORY_MAX_PAGE_SIZE', 200)
+    limit = request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50), type=int)
+    limit = max(1, min(limit, max_page_size))
+
+    try:
+        # Angle ranges, e.g. angle_with_midline_min=31&angle_with_midline_max=60
+        angles = {}
+        for name in ANALYSIS_ANGLES:
+            low = _float_arg(f'{name}_min')
+            high = _float_arg(f'{name}_max')
+            if low is not None or high is not None:
+                angles[name] = (low, high)
+
+        sector = request.args.get('sector')
+        created_from = request.args.get('from')
+        created_to = request.args.get('to')
+
+        # Admins search the whole cohort, everyone else their own detections
+        results, next_cursor = keypoint_service.search_detections(
+            user_id=None if current_user_is_admin() else user_id,
+            sector=int(sector) if sector else None,
+            impaction_type=request.args.get('impaction_type'),
+            prediction=request.args.get('prediction'),
+            angles=angles,
+            created_from=datetime.fromisoformat(created_from) if created_from else None,
+            created_to=datetime.fromisoformat(created_to) if created_to else None,
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+
+        return jsonify({
+            'status': 'success',
+            'detections': results,
+            'next_cursor': next_cursor
+        })
+
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    except Exception as e:
+        current_app.logger.error(f"Error searching detections: {str(e)}")
+        current_app.logger.error(traceback.format_exc())
+        return jsonify({
+            'status': 'error',
+            'message': f'Error searching detections: {str(e)}'
+        }), 500
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid number for {name}: {value}")
+
 @prediction_bp.route('/uploads/<filename>', methods=['GET'])
 def uploaded_file(filename):
-    return send_from_directory(os.path.join(current_app.root_path, 'uploads'), filename)
+    return _send_blob(upload_store, filename)
 
 @prediction_bp.route('/results/<filename>', methods=['GET'])
 def result_file(filename):
-    return send_from_directory(os.path.join(current_app.root_path, 'results'), filename)
+    return _send_blob(result_store, filename)
+
+@prediction_bp.route('/uploads/<any(thumb, preview):variant>/<filename>', methods=['GET'])
+def uploaded_derivative(variant, filename):
+    return _send_derivative('uploads', filename, variant)
+
+@prediction_bp.route('/results/<any(thumb, preview):variant>/<filename>', methods=['GET'])
+def result_derivative(variant, filename):
+    return _send_derivative('results', filename, variant)
+
+def _send_derivative(store_name, key, variant):
+    # The source may still be on the artifact writer
+    _wait_for_artifact(derivative_service.stores[store_name], key)
+
+    # Rendered on first access for images stored before derivatives existed
+    path = derivative_service.get(store_name, key, variant)
+    if path is None:
+        abort(404)
+
+    if KEY_PATTERN.match(key):
+        # The file name carries the content hash, variant, quality and format
+        etag = os.path.basename(path)
+        return _send_immutable(path, etag, mimetype=derivative_service.mimetype)
+    return send_file(path, mimetype=derivative_service.mimetype, conditional=True,
+                     max_age=current_app.config['LEGACY_BLOB_MAX_AGE'])
+
+def _send_blob(store, key):
+    # Resolves sharded blob keys as well as legacy flat filenames
+    path = store.path(key)
+    if path is None and _wait_for_artifact(store, key):
+        path = store.path(key)
+    if path is None:
+        abort(404)
+
+    if KEY_PATTERN.match(key):
+        # The key is the content hash, so it doubles as a strong validator
+        return _send_immutable(path, os.path.splitext(key)[0])
+    return send_file(path, conditional=True, max_age=current_app.config['LEGACY_BLOB_MAX_AGE'])
+
+def _wait_for_artifact(store, key):
+    """Wait for an overlay that is still being written; return False if none is pending.
+
+    Answers 503 with Retry-After when the write outlasts ARTIFACT_WAIT_TIMEOUT.
+    """
+    timeout = current_app.config.get('ARTIFACT_WAIT_TIMEOUT', 10)
+    try:
+        # A result requested right after /analyze returned can still be encoding in this worker
+        if artifact_writer.wait(store, key, timeout=timeout):
+            return True
+    except Exception:
+        return False
+
+    if store is not result_store or not KEY_PATTERN.match(key):
+        return False
+    try:
+        # ...or in the worker that served /analyze, which commits before the write lands
+        return keypoint_service.wait_for_overlay(key, timeout)
+    except TimeoutError:
+        response = jsonify({
+            'status': 'error',
+            'message': 'The result image is still being written. Please try again shortly.'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        abort(response)
+
+def _send_immutable(path, etag, mimetype=None):
+    """Send a file that never changes: strong ETag, long-lived immutable caching, 304s and ranges"""
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=etag,
+        conditional=True,
+        max_age=current_app.config['BLOB_CACHE_MAX_AGE']
+    )
+    response.cache_control.immutable = True
+    return response
@@ -4,9 +4,10 @@ user_bp = Blueprint('user', __name__)
 
 # Import User model and database instance
 from models import User
-from config import db
+from config import db, read_replica
 
 @user_bp.route('/user/all', methods=['GET'])
+@read_replica
 def index():
     try:
         # Query all users from the database
@@ -1,21 +1,56 @@
 from flask import Flask
 from .keypoint_detection import KeypointDetectionService
 from .segmentation import SegmentationService
+from .scheduler import InferenceScheduler, INTERACTIVE, BULK
+from .storage import BlobStore
+from .derivatives import DerivativeService
+from .artifacts import ArtifactWriter
+from .analytics import AnalyticsService
+from utils.metrics import MODEL_LOADED
 
 # Initialize services
-keypoint_service = KeypointDetectionService()
-segmentation_service = SegmentationService()
+inference_scheduler = InferenceScheduler()
+upload_store = BlobStore('uploads', config_key='UPLOAD_FOLDER')
+result_store = BlobStore('results', config_key='RESULTS_FOLDER')
+derivative_service = DerivativeService(stores={'uploads': upload_store, 'results': result_store})
+artifact_writer = ArtifactWriter()
+keypoint_service = KeypointDetectionService(
+    scheduler=inference_scheduler,
+    upload_store=upload_store,
+    result_store=result_store,
+    derivatives=derivative_service,
+    artifacts=artifact_writer
+)
+segmentation_service = SegmentationService(
+    scheduler=inference_scheduler,
+    result_store=result_store,
+    artifacts=artifact_writer
+)
+analytics_service = AnalyticsService()
 
 def init_app(app: Flask):
     # Set configuration for model paths
     app.config['YOLO_MODEL_PATH'] = app.config.get('YOLO_MODEL_PATH', 'models/keypoint/best.pt')
     app.config['SEGMENTATION_MODEL_PATH'] = app.config.get('SEGMENTATION_MODEL_PATH', 'models/segmentation/best.pt')
 
+    # Configure the shared inference scheduler and blob stores before the services use them
+    inference_scheduler.init_app(app)
+    upload_store.init_app(app)
+    result_store.init_app(app)
+    derivative_service.init_app(app)
+    artifact_writer.init_app(app)
+
     # Initialize keypoint detection service
     keypoint_service.init_app(app)
 
     # Initialize segmentation service
     segmentation_service.init_app(app)
 
+    analytics_service.init_app(app)
+
+    # Publish model load state for /metrics
+    MODEL_LOADED.labels(model='keypoint').set(1 if keypoint_service.model is not None else 0)
+    MODEL_LOADED.labels(model='segmentation').set(1 if segmentation_service.model is not None else 0)
+
     # Log successful initialization
     app.logger.info("Services initialized successfully")
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, time
+
+from sqlalchemy import func, text
+
+from config import db
+from models import User, DetectionDailyStats, AnalyticsRefresh
+
+ROLLUP = 'detection_daily_stats'
+
+# Recomputes whole days from :start on; sector and impaction type come from the summary columns
+REFRESH_SQL = text("""
+    INSERT INTO detection_daily_stats
+        (day, user_id, prediction_result, sector, impaction_type, confidence_bucket, detections, confidence_sum)
+    SELECT
+        created_at::date,
+        user_id,
+        prediction_result,
+        sector,
+        impaction_type,
+        LEAST(FLOOR(confidence_score * 10), 9)::int,
+        COUNT(*),
+        SUM(confidence_score)
+    FROM keypoint_detections
+    WHERE created_at >= :start
+    GROUP BY 1, 2, 3, 4, 5, 6
+""")
+
+class AnalyticsService:
+    """Admin dashboard aggregates, served from the detection_daily_stats rollup.
+
+    The rollup is refreshed incrementally by `flask analytics-refresh`: only the
+    days from the last high-water mark on are recomputed, so a refresh costs
+    the same however many detections are already rolled up.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.settle = timedelta(minutes=10)
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # Detections committed a little after their created_at are still picked up
+        self.settle = timedelta(seconds=int(app.config.get('ANALYTICS_SETTLE_SECONDS', 600)))
+
+    def refresh(self, full=False):
+        """Recompute the rollup from the high-water mark on; returns (first day, rows written)"""
+        try:
+            # Serialise overlapping refreshes (e.g. a slow run and the next cron tick)
+            db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': ROLLUP})
+
+            now = datetime.utcnow()
+            state = AnalyticsRefresh.query.get(ROLLUP)
+
+            if state is None or full:
+                start_at = datetime.min
+            else:
+                start_at = datetime.combine((state.refreshed_through - self.settle).date(), time.min)
+
+            DetectionDailyStats.query.filter(DetectionDailyStats.day >= start_at.date()).delete(
+                synchronize_session=False
+            )
+            rows = db.session.execute(REFRESH_SQL, {'start': start_at}).rowcount
+
+            if state is None:
+                state = AnalyticsRefresh(name=ROLLUP, refreshed_through=now)
+                db.session.add(state)
+            state.refreshed_through = now
+
+            # One transaction, so dashboards see either the old or the new days, never a gap
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return start_at.date(), rows
+
+    def summary(self, start, end, user_id=None, top=10):
+        """Aggregates for detections from day start to day end inclusive"""
+        stats = DetectionDailyStats
+        count = func.sum(stats.detections)
+
+        def filtered(*columns):
+            query = db.session.query(*columns).filter(stats.day >= start, stats.day <= end)
+            if user_id is not None:
+                query = query.filter(stats.user_id == user_id)
+            return query
+
+        def grouped(column):
+            return filtered(column, count).group_by(column)
+
+        total, confidence_sum = filtered(count, func.sum(stats.confidence_sum)).one()
+
+        user_volume = (
+            filtered(stats.user_id, count, User.username)
+            .outerjoin(User, User.id == stats.user_id)
+            .group_by(stats.user_id, User.username)
+            .order_by(count.desc())
+            .limit(top)
+        )
+
+        state = AnalyticsRefresh.query.get(ROLLUP)
+
+        return {
+            'range': {'from': start.isoformat(), 'to': end.isoformat()},
+            'refreshed_through': state.refreshed_through.isoformat() if state else None,
+            'total_detections': int(total or 0),
+            'average_confidence': (confidence_sum / total) if total and confidence_sum is not None else None,
+            'prediction_distribution': {
+                prediction or 'unknown': int(n) for prediction, n in grouped(stats.prediction_result)
+            },
+            'sectors': {str(sector) if sector is not None else 'unknown': int(n) for sector, n in grouped(stats.sector)},
+            'impaction_types': {
+                impaction_type or 'unknown': int(n) for impaction_type, n in grouped(stats.impaction_type)
+            },
+            'confidence_histogram': [
+                {'from': bucket / 10, 'to': (bucket + 1) / 10, 'count': int(n)}
+                for bucket, n in grouped(stats.confidence_bucket).order_by(stats.confidence_bucket)
+                if bucket is not None
+            ],
+            'daily_volume': [
+                {'day': day.isoformat(), 'count': int(n)}
+                for day, n in grouped(stats.day).order_by(stats.day)
+            ],
+            'user_volume': [
+                {'user_id': uid, 'username': username, 'count': int(n)}
+                for uid, n, username in user_volume
+            ]
+        }
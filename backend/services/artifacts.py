@@ -0,0 +1,153 @@
+import contextvars
+import secrets
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import cv2
+
+from utils.metrics import stage
+from utils.tracing import span, hold_trace
+from .storage import ARTIFACT_KEY_BYTES
+
+# Format name -> (file extension, cv2 encode flag, config key holding the level)
+ENCODINGS = {
+    'jpeg': ('jpg', cv2.IMWRITE_JPEG_QUALITY, 'ARTIFACT_JPEG_QUALITY'),
+    'webp': ('webp', cv2.IMWRITE_WEBP_QUALITY, 'ARTIFACT_WEBP_QUALITY'),
+    'png': ('png', cv2.IMWRITE_PNG_COMPRESSION, 'ARTIFACT_PNG_COMPRESSION')
+}
+
+DEFAULT_LEVELS = {
+    'ARTIFACT_JPEG_QUALITY': 90,
+    'ARTIFACT_WEBP_QUALITY': 85,
+    'ARTIFACT_PNG_COMPRESSION': 3
+}
+
+# Failed writes remembered for callers that ask after the future is gone
+FAILED_HISTORY = 1024
+
+class ArtifactWriter:
+    """Encodes and persists rendered result images on a background pool.
+
+    Keys are assigned up front (a random id plus the format extension) so the
+    caller can reference the artifact in the database before the bytes are on
+    disk. Each write returns a future. By default the detection commits without
+    waiting and marks its overlays pending until they land (see
+    KeypointDetectionService._store_detection); with ARTIFACT_AWAIT_COMMIT it
+    waits instead, so a committed key always has its file.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.format = 'jpeg'
+        self.level = DEFAULT_LEVELS['ARTIFACT_JPEG_QUALITY']
+        self.fsync = False
+        self.await_commit = False
+        self.executor = None
+        self._pending = {}
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.format = app.config.get('ARTIFACT_FORMAT', self.format).lower()
+        if self.format not in ENCODINGS:
+            app.logger.warning(f"Unknown artifact format '{self.format}', using 'jpeg'")
+            self.format = 'jpeg'
+
+        level_key = ENCODINGS[self.format][2]
+        self.level = int(app.config.get(level_key, DEFAULT_LEVELS[level_key]))
+        self.fsync = app.config.get('ARTIFACT_FSYNC', 'never') == 'always'
+        self.await_commit = bool(app.config.get('ARTIFACT_AWAIT_COMMIT', False))
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=int(app.config.get('ARTIFACT_WORKERS', 2)),
+                thread_name_prefix='artifacts'
+            )
+
+        app.logger.info(
+            f"Artifact writer: format={self.format}, level={self.level}, fsync={self.fsync}, "
+            f"await_commit={self.await_commit}"
+        )
+
+    @property
+    def extension(self):
+        return ENCODINGS[self.format][0]
+
+    def submit(self, store, image):
+        """Queue a BGR image for encoding and storage; return (key, future)"""
+        key = f"{secrets.token_hex(ARTIFACT_KEY_BYTES)}.{self.extension}"
+
+        if self.executor is None:
+            # Not initialised (scripts, benchmarks): write inline
+            future = Future()
+            try:
+                future.set_result(self._write_logged(store, key, image))
+            except Exception as e:
+                future.set_exception(e)
+            return key, future
+
+        # Run in a copy of the caller's context so the write's spans join the request trace,
+        # which is held back from export until the write has finished
+        context = contextvars.copy_context()
+        with self._lock:
+            future = self.executor.submit(context.run, self._write_logged, store, key, image)
+            self._pending[(store.name, key)] = future
+        release_trace = hold_trace()
+        future.add_done_callback(lambda _: self._forget(store.name, key))
+        future.add_done_callback(lambda _: release_trace())
+        return key, future
+
+    def pending(self, store, key):
+        """Return the future of an unfinished write of key, or None"""
+        with self._lock:
+            return self._pending.get((store.name, key))
+
+    def wait(self, store, key, timeout=None):
+        """Block until a pending write of key has finished; return False if none is pending.
+
+        Raises the write's exception if it failed, including recently finished writes.
+        """
+        future = self.pending(store, key)
+        if future is None:
+            with self._lock:
+                error = self._failed.get((store.name, key))
+            if error is not None:
+                raise error
+            return False
+        future.result(timeout=timeout)
+        return True
+
+    def _write(self, store, key, image):
+        _, flag, _ = ENCODINGS[self.format]
+        with stage('artifact_encode'):
+            ok, encoded = cv2.imencode(f".{self.extension}", image, [flag, self.level])
+        if not ok:
+            raise ValueError(f"Could not encode artifact {key}")
+
+        with stage('artifact_write'):
+            store.put_bytes(encoded.tobytes(), self.extension, key=key, fsync=self.fsync)
+        return key
+
+    def _write_logged(self, store, key, image):
+        try:
+            with span('artifact', store=store.name, key=key):
+                return self._write(store, key, image)
+        except Exception as e:
+            if self.app:
+                self.app.logger.error(f"Error writing artifact {store.name}/{key}: {str(e)}")
+                self.app.logger.error(traceback.format_exc())
+            with self._lock:
+                self._failed[(store.name, key)] = e
+                while len(self._failed) > FAILED_HISTORY:
+                    self._failed.popitem(last=False)
+            raise
+
+    def _forget(self, store_name, key):
+        with self._lock:
+            self._pending.pop((store_name, key), None)
@@ -0,0 +1,164 @@
+import glob
+import os
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from utils.metrics import stage
+
+# Longest edge in pixels for each derivative, largest first
+VARIANTS = {
+    'preview': 1024,
+    'thumb': 256
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg')
+}
+
+class DerivativeService:
+    """Downscaled thumbnails and previews of stored uploads and results.
+
+    Derivatives live under <DERIVATIVES_FOLDER>/<store>/ab/cd/<stem>_<variant>-q<quality>.<ext>,
+    so changing DERIVATIVE_FORMAT or DERIVATIVE_QUALITY renders new files
+    instead of serving stale ones under a new validator.
+    They are rendered on a background pool right after a detection is stored,
+    and lazily on first request for images that predate the pipeline.
+    """
+
+    def __init__(self, stores=None, app=None):
+        self.app = app
+        self.stores = stores or {}
+        self.root = os.path.join(os.getcwd(), 'derivatives')
+        self.format = 'webp'
+        self.quality = 80
+        self.executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.root = app.config.get('DERIVATIVES_FOLDER', self.root)
+        self.format = app.config.get('DERIVATIVE_FORMAT', self.format).lower()
+        self.quality = int(app.config.get('DERIVATIVE_QUALITY', self.quality))
+
+        if self.format not in FORMATS:
+            app.logger.warning(f"Unknown derivative format '{self.format}', using 'webp'")
+            self.format = 'webp'
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=int(app.config.get('DERIVATIVE_WORKERS', 2)),
+                thread_name_prefix='derivatives'
+            )
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.format][2]
+
+    def path(self, store_name, key, variant):
+        stem = os.path.splitext(key)[0]
+        ext = FORMATS[self.format][1]
+        return os.path.join(self.root, store_name, stem[0:2], stem[2:4], f"{stem}_{variant}-q{self.quality}.{ext}")
+
+    def renditions(self, store_name, key):
+        """Return every derivative file of a blob, in any variant, format or quality"""
+        stem = os.path.splitext(os.path.basename(key))[0]
+        directory = os.path.join(self.root, store_name, stem[0:2], stem[2:4])
+        return glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(stem)}_*"))
+
+    def urls(self, store_name, key):
+        """Return the public URL of every variant of a stored image"""
+        key = os.path.basename(key)
+        return {variant: f"/{store_name}/{variant}/{key}" for variant in VARIANTS}
+
+    def schedule(self, store_name, key, after=None):
+        """Render all variants of a blob in the background, once the after future is done"""
+        if self.executor is None or not key:
+            return None
+
+        if after is not None and not after.done():
+            after.add_done_callback(lambda _: self.schedule(store_name, key))
+            return None
+
+        key = os.path.basename(key)
+        with self._lock:
+            future = self._pending.get((store_name, key))
+            if future is None:
+                future = self.executor.submit(self._generate_logged, store_name, key)
+                self._pending[(store_name, key)] = future
+                future.add_done_callback(lambda _: self._forget(store_name, key))
+        return future
+
+    def get(self, store_name, key, variant):
+        """Return the path of a derivative, rendering it now if it does not exist yet"""
+        if variant not in VARIANTS or store_name not in self.stores:
+            return None
+        if os.path.basename(key) != key or key.startswith('.'):
+            return None
+
+        path = self.path(store_name, key, variant)
+        if os.path.exists(path):
+            return path
+
+        # Wait for a background render already in flight rather than duplicating it
+        with self._lock:
+            future = self._pending.get((store_name, key))
+        if future is not None:
+            future.result()
+        else:
+            self.generate(store_name, key)
+
+        return path if os.path.exists(path) else None
+
+    def generate(self, store_name, key):
+        """Decode the source once and write every variant, largest first"""
+        source_path = self.stores[store_name].path(key)
+        if source_path is None:
+            return False
+
+        pil_format, _, _ = FORMATS[self.format]
+        with stage('derivatives'), Image.open(source_path) as image:
+            # Let the JPEG decoder downscale by a power of two while decoding
+            largest = max(VARIANTS.values())
+            image.draft('RGB', (largest, largest))
+            image = image.convert('RGB')
+
+            for variant, size in VARIANTS.items():
+                image.thumbnail((size, size), Image.LANCZOS)
+                self._write(image, self.path(store_name, key, variant), pil_format)
+
+        return True
+
+    def _write(self, image, path, pil_format):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, pil_format, quality=self.quality)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _generate_logged(self, store_name, key):
+        try:
+            return self.generate(store_name, key)
+        except Exception as e:
+            if self.app:
+                self.app.logger.error(f"Error generating derivatives for {store_name}/{key}: {str(e)}")
+                self.app.logger.error(traceback.format_exc())
+            return False
+
+    def _forget(self, store_name, key):
+        with self._lock:
+            self._pending.pop((store_name, key), None)
@@ -0,0 +1,187 @@
+import io
+import math
+import time
+import numpy as np
+import cv2
+import torch
+from PIL import Image
+from ultralytics.engine.results import Results
+
+# Keypoint order used by the trained pose model (see models/keypoint/notes.json)
+KEYPOINT_LABELS = [
+    "c11", "c12", "c13", "c14", "c15",
+    "c21", "c22", "c23", "c24", "c25",
+    "m1", "m2", "mb16", "mb26",
+    "r11", "r12", "r13", "r14", "r15",
+    "r21", "r22", "r23", "r24", "r25"
+]
+
+SEGMENTATION_NAMES = {
+    0: "Central incisor",
+    1: "First premolar",
+    2: "Impacted canine",
+    3: "Lateral incisor",
+    4: "Second premolar"
+}
+
+# Horizontal offset from the midline (fraction of width) for teeth 1-5 of a quadrant
+TOOTH_OFFSETS = {1: 0.035, 2: 0.085, 3: 0.13, 4: 0.17, 5: 0.21}
+
+# Segmentation class id for teeth 1-5 of a quadrant
+TOOTH_CLASSES = {1: 0, 2: 3, 3: 2, 4: 1, 5: 4}
+
+class FakeYOLO:
+    """Stand-in for an ultralytics YOLO model that needs no weights or network.
+
+    Returns real ``ultralytics.engine.results.Results`` objects built from
+    synthetic but anatomically plausible boxes, masks and keypoints, so the
+    services, ``Results.plot()`` and the analysis code run unchanged.
+    """
+
+    def __init__(self, task='pose', seed=0, imgsz=640, latency_ms=0.0, latency_jitter_ms=0.0,
+                 per_image_ms=0.0, confidence_range=(0.6, 0.99), missing_keypoint_rate=0.0, empty_rate=0.0):
+        self.task = task
+        self.imgsz = imgsz
+        self.rng = np.random.default_rng(seed)
+        self.names = SEGMENTATION_NAMES if task == 'segment' else {0: "teeth"}
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.per_image_ms = per_image_ms
+        self.confidence_range = confidence_range
+        self.missing_keypoint_rate = missing_keypoint_rate
+        self.empty_rate = empty_rate
+
+    @classmethod
+    def from_config(cls, config, task):
+        """Build a fake model from FAKE_MODEL_* settings"""
+        return cls(
+            task=task,
+            seed=int(config.get('FAKE_MODEL_SEED', 0)),
+            latency_ms=float(config.get('FAKE_MODEL_LATENCY_MS', 0)),
+            latency_jitter_ms=float(config.get('FAKE_MODEL_LATENCY_JITTER_MS', 0)),
+            per_image_ms=float(config.get('FAKE_MODEL_PER_IMAGE_MS', 0)),
+            confidence_range=(
+                float(config.get('FAKE_MODEL_MIN_CONFIDENCE', 0.6)),
+                float(config.get('FAKE_MODEL_MAX_CONFIDENCE', 0.99))
+            ),
+            missing_keypoint_rate=float(config.get('FAKE_MODEL_MISSING_KEYPOINT_RATE', 0)),
+            empty_rate=float(config.get('FAKE_MODEL_EMPTY_RATE', 0))
+        )
+
+    def __call__(self, source, verbose=False, **kwargs):
+        sources = source if isinstance(source, list) else [source]
+        self._simulate_latency(len(sources))
+        return [self._predict_one(self._to_bgr(image)) for image in sources]
+
+    def _simulate_latency(self, batch_size):
+        delay = self.latency_ms + self.per_image_ms * batch_size
+        if self.latency_jitter_ms:
+            delay += self.rng.normal(0, self.latency_jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _to_bgr(self, image):
+        if isinstance(image, Image.Image):
+            return cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+        if isinstance(image, str):
+            return cv2.imread(image, cv2.IMREAD_COLOR)
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+    def _predict_one(self, image):
+        if self.empty_rate and self.rng.random() < self.empty_rate:
+            return Results(image, path='fake.jpg', names=self.names, boxes=torch.zeros((0, 6)))
+
+        if self.task == 'segment':
+            boxes, masks = self._segmentation(image.shape[:2])
+            return Results(image, path='fake.jpg', names=self.names, boxes=boxes, masks=masks)
+
+        boxes, keypoints = self._pose(image.shape[:2])
+        return Results(image, path='fake.jpg', names=self.names, boxes=boxes, keypoints=keypoints)
+
+    def _tooth_geometry(self, height, width):
+        """Yield (quadrant, tooth, root_xy, crown_xy) for both upper quadrants"""
+        impacted_quadrant = 1 if self.rng.random() < 0.5 else 2
+        jitter = 0.01 * width
+
+        for quadrant, direction in ((1, 1), (2, -1)):
+            for tooth, offset in TOOTH_OFFSETS.items():
+                x = width / 2 + direction * offset * width + self.rng.normal(0, jitter)
+                root = (x + self.rng.normal(0, jitter), 0.33 * height + self.rng.normal(0, jitter))
+                crown = (x + self.rng.normal(0, jitter), 0.55 * height + self.rng.normal(0, jitter))
+
+                # The impacted canine sits higher, tilted towards the midline
+                if tooth == 3 and quadrant == impacted_quadrant:
+                    crown = (x - direction * 0.03 * width, 0.42 * height + self.rng.normal(0, jitter))
+
+                yield quadrant, tooth, root, crown
+
+    def _segmentation(self, shape):
+        height, width = shape
+        scale = self.imgsz / max(height, width)
+        mask_h = int(math.ceil(height * scale / 32) * 32)
+        mask_w = int(math.ceil(width * scale / 32) * 32)
+        pad_x = (mask_w - width * scale) / 2
+        pad_y = (mask_h - height * scale) / 2
+
+        boxes = []
+        masks = []
+        for quadrant, tooth, root, crown in self._tooth_geometry(height, width):
+            cls = TOOTH_CLASSES[tooth]
+            half_w = 0.018 * width
+            x1 = min(root[0], crown[0]) - half_w
+            x2 = max(root[0], crown[0]) + half_w
+            y1 = min(root[1], crown[1])
+            y2 = max(root[1], crown[1])
+            boxes.append([x1, y1, x2, y2, float(self.rng.uniform(*self.confidence_range)), cls])
+
+            # Tooth outline as a rotated ellipse in letterboxed mask space
+            mask = np.zeros((mask_h, mask_w), dtype=np.uint8)
+            center = (int((x1 + x2) / 2 * scale + pad_x), int((y1 + y2) / 2 * scale + pad_y))
+            axes = (max(1, int(half_w * scale)), max(1, int((y2 - y1) / 2 * scale)))
+            angle = math.degrees(math.atan2(crown[0] - root[0], crown[1] - root[1]))
+            cv2.ellipse(mask, center, axes, -angle, 0, 360, 1, -1)
+            masks.append(mask)
+
+        return (
+            torch.tensor(boxes, dtype=torch.float32),
+            torch.from_numpy(np.stack(masks).astype(np.float32))
+        )
+
+    def _pose(self, shape):
+        height, width = shape
+        points = {
+            "m1": (width / 2, 0.28 * height),
+            "m2": (width / 2, 0.6 * height),
+            "mb16": (width / 2 + 0.26 * width, 0.58 * height),
+            "mb26": (width / 2 - 0.26 * width, 0.58 * height)
+        }
+        for quadrant, tooth, root, crown in self._tooth_geometry(height, width):
+            points[f"r{quadrant}{tooth}"] = root
+            points[f"c{quadrant}{tooth}"] = crown
+
+        keypoints = []
+        for label in KEYPOINT_LABELS:
+            x, y = points[label]
+            confidence = float(self.rng.uniform(*self.confidence_range))
+            if self.missing_keypoint_rate and self.rng.random() < self.missing_keypoint_rate:
+                confidence = float(self.rng.uniform(0.0, 0.2))
+            keypoints.append([x, y, confidence])
+        keypoints = np.array(keypoints, dtype=np.float32)
+
+        x1, y1 = keypoints[:, :2].min(axis=0)
+        x2, y2 = keypoints[:, :2].max(axis=0)
+        boxes = torch.tensor([[x1, y1, x2, y2, float(self.rng.uniform(0.7, 0.95)), 0]], dtype=torch.float32)
+
+        return boxes, torch.from_numpy(keypoints[None])
+
+def synthetic_radiograph(width=2800, height=1400, seed=0):
+    """Return JPEG bytes of a panoramic-sized grayscale image"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :]
+    noise = rng.normal(0, 25, (height, width)).astype(np.float32)
+    image = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
@@ -1,34 +1,61 @@
 import os
-import uuid
-import cv2
-import numpy as np
 import json
 import traceback
-import time
 import math
+import time
 from ultralytics import YOLO
-from pathlib import Path
 from PIL import Image
-import torch
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_, insert
+from sqlalchemy.orm import load_only
 from config import db
-from models import KeypointDetection, Keypoint
+from models import KeypointDetection, Keypoint, PendingArtifact
+from models.keypoint import analysis_angle
+from .scheduler import INTERACTIVE
+from .fake_model import FakeYOLO
+from .storage import BlobStore, IMAGE_EXTENSIONS
+from .artifacts import ArtifactWriter
+from utils.tracing import traced
+from utils.metrics import stage, PREDICTIONS
+from utils.pagination import encode_cursor, decode_cursor
+from utils.ids import new_ulid
+from utils.keypoints import label_version, pack_keypoints, unpack_keypoints, keypoints_from_array
+
+# Impaction type recorded when the keypoints were not enough to place the canine
+NO_DETECTION = 'no detection'
+
+# KEYPOINT_STORAGE values: normalised keypoints rows, the packed array column, or both
+KEYPOINT_STORAGE_MODES = ('rows', 'packed', 'both')
 
 class KeypointDetectionService:
-    def __init__(self, app=None):
+    def __init__(self, app=None, scheduler=None, upload_store=None, result_store=None, derivatives=None,
+                 artifacts=None):
         self.app = app
         self.model = None
-        self.upload_folder = os.path.join(os.getcwd(), 'uploads')
-        self.results_folder = os.path.join(os.getcwd(), 'results')
-
-        # Ensure directories exist
-        os.makedirs(self.upload_folder, exist_ok=True)
-        os.makedirs(self.results_folder, exist_ok=True)
+        self.scheduler = scheduler
+        self.upload_store = upload_store or BlobStore('uploads')
+        self.result_store = result_store or BlobStore('results')
+        self.derivatives = derivatives
+        self.artifacts = artifacts or ArtifactWriter()
+        self.keypoint_storage = 'packed'
+        self._labels = None
 
         if app:
             self.init_app(app)
 
     def init_app(self, app):
         self.app = app
+        self.keypoint_storage = app.config.get('KEYPOINT_STORAGE', self.keypoint_storage)
+        if self.keypoint_storage not in KEYPOINT_STORAGE_MODES:
+            app.logger.warning(f"Unknown keypoint storage '{self.keypoint_storage}', using 'packed'")
+            self.keypoint_storage = 'packed'
+
+        # Local stand-in for load tests and benchmarks, never downloads weights
+        if app.config.get('MODEL_BACKEND') == 'fake':
+            self.model = FakeYOLO.from_config(app.config, task='pose')
+            app.logger.info("Using fake keypoint model backend")
+            return
+
         # Load YOLO model - use a path to your trained model
         try:
             model_path = app.config.get('YOLO_MODEL_PATH', 'models/keypoint/best.pt')
@@ -44,13 +71,43 @@ class KeypointDetectionService:
                 app.logger.error("Could not load any YOLO model")
 
     def save_image(self, image_file):
-        """Save uploaded image to disk and return the path"""
-        filename = f"{uuid.uuid4().hex}.jpg"
-        file_path = os.path.join(self.upload_folder, filename)
-        image_file.save(file_path)
-        return file_path
-
-    def detect_keypoints(self, image_path, user_id, segmentation_data=None):
+        """Store an uploaded image by content hash, keeping its format, and return the path"""
+        stream = getattr(image_file, 'stream', image_file)
+        ext = self._image_extension(stream)
+        # Uploads spooled by the request are hashed while they are received
+        digest = getattr(stream, 'sha256', None)
+        key = self.upload_store.put_stream(stream, ext, sha256=digest.hexdigest() if digest else None)
+        return self.upload_store.path(key)
+
+    def save_image_from_path(self, source_path, move=False):
+        """Store an image that is already on disk and return the new path"""
+        with open(source_path, 'rb') as f:
+            ext = self._image_extension(f)
+        key = self.upload_store.put_file(source_path, ext, move=move)
+        return self.upload_store.path(key)
+
+    def _image_extension(self, stream):
+        """Sniff the image format from the header and rewind the stream"""
+        position = stream.tell()
+        try:
+            image_format = Image.open(stream).format
+        except Exception:
+            image_format = None
+        stream.seek(position)
+        return IMAGE_EXTENSIONS.get(image_format, 'jpg')
+
+    def _predict(self, image, priority=INTERACTIVE):
+        """Run the keypoint model through the inference scheduler"""
+        if self.scheduler is None:
+            with stage('keypoint_inference'):
+                return self.model(image, verbose=False)
+
+        with self.scheduler.slot(priority):
+            with stage('keypoint_inference'):
+                return self.model(image, verbose=False)
+
+    @traced()
+    def detect_keypoints(self, image_path, user_id, segmentation_data=None, priority=INTERACTIVE):
         """Process image with YOLO and detect keypoints"""
         try:
             # Check if model is loaded
@@ -61,22 +118,202 @@ class KeypointDetectionService:
             # Load image
             image = Image.open(image_path)
 
-            # Run inference
-            results = self.model(image, verbose=False)
+            # Run inference, waiting behind higher priority work if needed
+            results = self._predict(image, priority)
+
+        except Exception as e:
+            self.app.logger.error(f"Error in keypoint detection: {str(e)}")
+            self.app.logger.error(traceback.format_exc())
+            raise
+
+        return self._process_results(results, image_path, user_id, segmentation_data)
+
+    @traced()
+    def detect_keypoints_batch(self, image_paths, user_id, segmentation_batch=None, priority=INTERACTIVE,
+                               images=None, commit=True):
+        """Detect keypoints on several images with a single model call.
+
+        Returns one result dict per image, in input order. A failure on one image
+        is reported as an error entry and does not abort the rest of the batch.
+        Already decoded images (BGR arrays) can be passed to skip loading from disk.
+        With commit=False the rows of the whole batch are inserted together at the
+        end and the caller commits.
+        """
+        return list(self.iter_keypoints_batch(image_paths, user_id, segmentation_batch, priority, images, commit))
+
+    def iter_keypoints_batch(self, image_paths, user_id, segmentation_batch=None, priority=INTERACTIVE,
+                             images=None, commit=True):
+        """Like detect_keypoints_batch, but yield each image's result as soon as it is stored.
+
+        With commit=False the rows are only inserted after the last result, so the
+        generator has to be exhausted.
+        """
+        if self.model is None:
+            self.app.logger.error("YOLO model not loaded")
+            raise ValueError("Model not initialized")
+
+        if segmentation_batch is None:
+            segmentation_batch = [None] * len(image_paths)
+
+        if images is None:
+            images = [Image.open(image_path) for image_path in image_paths]
+        results = self._predict(images, priority)
+
+        pending = None if commit else []
+        for result, image_path, segmentation_data in zip(results, image_paths, segmentation_batch):
+            try:
+                yield self._process_results([result], image_path, user_id, segmentation_data, pending=pending)
+            except Exception as e:
+                yield {
+                    "status": "error",
+                    "message": str(e)
+                }
+
+        if pending:
+            with stage('db_commit'):
+                self.persist_detections(pending)
+                db.session.flush()
+
+    def persist_detections(self, records):
+        """Insert detections and their keypoints with one multi-row INSERT per table.
+
+        records is a list of (detection column values, keypoints) pairs, keypoints
+        being the dicts returned by _extract_keypoints. The caller commits.
+        """
+        if not records:
+            return
+
+        # Core inserts skip the unit of work, so fill the Python-side default here
+        now = datetime.utcnow()
+        detection_rows = [{'created_at': now, **values} for values, _ in records]
+
+        if self.keypoint_storage in ('packed', 'both'):
+            labels, version = self._keypoint_labels()
+            for row, (_, keypoints) in zip(detection_rows, records):
+                row['keypoints_packed'] = pack_keypoints(keypoints, labels)
+                row['keypoints_version'] = version
+
+        db.session.execute(insert(KeypointDetection), detection_rows)
+        if self.keypoint_storage == 'packed':
+            return
+
+        keypoint_rows = [
+            {
+                'detection_id': values['id'],
+                'label': keypoint['label'],
+                'x_coord': keypoint['x'],
+                'y_coord': keypoint['y'],
+                'confidence': keypoint['confidence']
+            }
+            for values, keypoints in records
+            for keypoint in keypoints
+        ]
+        if keypoint_rows:
+            db.session.execute(insert(Keypoint), keypoint_rows)
+
+    def _store_detection(self, values, keypoints_data, commit=True, pending=None):
+        """Insert one detection now, or queue it on pending for a batch insert.
+
+        Overlay keys whose write failed are stored as NULL rather than pointing at
+        a missing file. Batch inserts, and every insert under ARTIFACT_AWAIT_COMMIT,
+        wait for their overlays. Otherwise the row commits right away with a
+        PendingArtifact marker per overlay still being written, removed when the
+        write lands (or, with the column cleared, when it fails).
+        """
+        columns = [column for column in ('result_path', 'segmentation_path') if values.get(column)]
+        writing = {}
+        if self.artifacts.await_commit or pending is not None:
+            with stage('artifact_wait'):
+                for column in columns:
+                    if not self._artifact_written(values[column]):
+                        values[column] = None
+        else:
+            for column in columns:
+                future = self.artifacts.pending(self.result_store, values[column])
+                if future is not None:
+                    writing[column] = future
+                elif not self._artifact_written(values[column]):
+                    # Already finished and failed
+                    values[column] = None
+
+        if pending is not None:
+            pending.append((values, keypoints_data))
+            return
+
+        with stage('db_commit'):
+            self.persist_detections([(values, keypoints_data)])
+            for column in writing:
+                db.session.add(PendingArtifact(key=values[column]))
+            if commit:
+                db.session.commit()
+            else:
+                db.session.flush()
+
+        for column, future in writing.items():
+            key = values[column]
+            future.add_done_callback(
+                lambda f, column=column, key=key: self._artifact_landed(column, key, f.exception() is None)
+            )
+
+    def _artifact_written(self, key):
+        """Wait for a pending overlay write; return False if it failed"""
+        try:
+            self.artifacts.wait(self.result_store, key)
+            return True
+        except Exception as e:
+            self.app.logger.error(f"Overlay {key} was not written, storing the detection without it: {str(e)}")
+            return False
+
+    def _artifact_landed(self, column, key, written):
+        """Drop the pending marker of a finished overlay write, pointing rows away from it if it failed"""
+        with self.app.app_context():
+            try:
+                PendingArtifact.query.filter_by(key=key).delete(synchronize_session=False)
+                if not written:
+                    KeypointDetection.query.filter(getattr(KeypointDetection, column) == key).update(
+                        {column: None}, synchronize_session=False
+                    )
+                    self.app.logger.warning(f"Cleared {column} {key} after its overlay write failed")
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Could not settle overlay {key}: {str(e)}")
+
+    def wait_for_overlay(self, key, timeout):
+        """Wait for an overlay another worker is still writing.
+
+        Returns True once it exists and False if no live write of it is pending.
+        Raises TimeoutError if the write is still pending after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        stale = timedelta(seconds=self.app.config.get('ARTIFACT_PENDING_SECONDS', 60))
+        while True:
+            if self.result_store.exists(key):
+                return True
+            created_at = db.session.query(PendingArtifact.created_at).filter_by(key=key).scalar()
+            # Give the connection back while sleeping
+            db.session.rollback()
+            # A marker older than the limit belongs to a worker that died mid-write
+            if created_at is None or created_at < datetime.utcnow() - stale:
+                return self.result_store.exists(key)
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Overlay {key} is still being written")
+            time.sleep(0.05)
 
-            # Generate unique filename for results
-            result_filename = f"{uuid.uuid4().hex}_result.jpg"
-            result_path = os.path.join(self.results_folder, result_filename)
+    def _process_results(self, results, image_path, user_id, segmentation_data=None, commit=True, pending=None):
+        """Render, analyse and store the model output for a single image.
 
-            # Plot results
-            result_image = results[0].plot()
-            cv2.imwrite(result_path, result_image)
+        When a pending list is given the rows are queued on it instead of inserted.
+        """
+        try:
+            # Plot results; encoding and writing the overlay happen on the artifact writer
+            with stage('plot_imwrite'):
+                result_image = results[0].plot()
+                result_key, result_written = self.artifacts.submit(self.result_store, result_image)
 
             # Get keypoints and confidence
             keypoints_data = []
-            confidence_score = 0.5  # Default confidence
             overall_confidence = 0.0
-            keypoints_count = 0
 
             # Load category names from the notes.json
             category_names = self._get_category_names()
@@ -97,86 +334,10 @@ class KeypointDetectionService:
                     # Debug info
                     self.app.logger.info(f"Single keypoint set shape: {kpts.shape}")
 
-                    # Convert keypoints to dict for easier access
-                    keypoints_dict = {}
-
-                    # Check keypoint structure
-                    if len(kpts.shape) == 2:
-                        # Format is [num_keypoints, 2] (x, y) without confidence
-                        self.app.logger.info("Keypoint format: [num_keypoints, 2] (x, y coordinates only)")
-
-                        # Use a default confidence of 0.8 for detected points
-                        model_confidence = float(results[0].boxes.conf[0]) if hasattr(results[0], 'boxes') and len(results[0].boxes) > 0 else 0.7
-                        
-                        default_confidence = min(0.7, max(0.5, model_confidence))
-                        
-                        overall_confidence = default_confidence
-                        keypoints_count = len(kpts)
-
-                        # Store keypoint data with default confidence
-                        for i, kp in enumerate(kpts):
-                            if i < len(category_names):
-                                label = category_names[i]
-                            else:
-                                label = f"point_{i}"
-
-                            keypoints_data.append({
-                                "label": label,
-                                "x": float(kp[0]),
-                                "y": float(kp[1]),
-                                "confidence": default_confidence
-                            })
-
-                            # Add to keypoints dict
-                            keypoints_dict[label] = {
-                                "x": float(kp[0]),
-                                "y": float(kp[1]),
-                                "confidence": default_confidence
-                            }
-
-                    elif len(kpts.shape) >= 2 and kpts.shape[1] >= 3:
-                        # Format is [num_keypoints, 3] (x, y, conf)
-                        self.app.logger.info("Keypoint format: [num_keypoints, 3] (x, y, confidence)")
-
-                        # Calculate overall confidence
-                        confidence_sum = 0.0
-
-                        # Store keypoint data with proper labels
-                        for i, kp in enumerate(kpts):
-                            conf = float(kp[2]) if len(kp) > 2 else 0.0
-                            if conf > 0.2:  # Include points with reasonable confidence
-                                label = category_names.get(i, f"point_{i}")
-                                keypoints_data.append({
-                                    "label": label,
-                                    "x": float(kp[0]),
-                                    "y": float(kp[1]),
-                                    "confidence": float(kp[2])
-                                })
-
-                                # Add to keypoints dict
-                                keypoints_dict[label] = {
-                                    "x": float(kp[0]),
-                                    "y": float(kp[1]),
-                                    "confidence": conf
-                                }
-
-                                confidence_sum += conf
-                                keypoints_count += 1
-
-                        # Calculate average confidence
-                        if keypoints_count > 0:
-                            overall_confidence = confidence_sum / keypoints_count
-                            expected_keypoints = len(category_names)
-                            if expected_keypoints > 0:
-                                completeness_factor = min(1.0, keypoints_count / expected_keypoints)
-                                confidence_score = confidence_score * (0.7 + 0.3 * completeness_factor)
-                            
-                            critical_points = ["m1", "m2", "r13", "c13"] 
-                            missing_critical = any(point not in keypoints_dict for point in critical_points)
-                            if missing_critical:
-                                confidence_score = confidence_score * 0.8
-                        else:
-                            confidence_score = 0.3
+                    # Convert keypoints to labelled points and a dict for easier access
+                    keypoints_data, keypoints_dict, overall_confidence = self._extract_keypoints(
+                        results[0], kpts, category_names
+                    )
 
                     # Check confidence and keypoints coverage
                     required_points = ["m1", "m2", "r11", "r12", "r13", "r14", "r15",
@@ -205,7 +366,8 @@ class KeypointDetectionService:
                     coverage_ratio = found_points_count / required_points_count
 
                     # Perform dental analysis
-                    analysis_results = self.perform_dental_analysis(keypoints_dict, segmentation_data)
+                    with stage('analysis'):
+                        analysis_results = self.perform_dental_analysis(keypoints_dict, segmentation_data)
 
                     # Add confidence and coverage information to analysis results
                     analysis_results["confidence"] = {
@@ -224,47 +386,46 @@ class KeypointDetectionService:
                     if analysis_results["sector_analysis"].get("impaction_type") == "Palatally impact" and analysis_results["sector_analysis"].get("sector") == 4:
                         analysis_results["note"] = "Palatally impacted canines in sector 4 typically require surgical intervention."
 
-                    # Create a detection ID
-                    detection_id = str(int(time.time() * 1000))
+                    # Time-sortable ID that cannot collide across workers or nodes
+                    detection_id = new_ulid()
 
                     segmentation_path = None
                     if segmentation_data and "result_image" in segmentation_data:
-                        segmentation_path = os.path.join(self.results_folder, segmentation_data["result_image"])
+                        segmentation_path = segmentation_data["result_image"]
 
-                    # Create new detection record in database
-                    new_detection = KeypointDetection(
+                    # Detection row values; paths are blob keys
+                    detection_values = dict(
                         id=detection_id,
                         user_id=user_id,
-                        image_path=image_path,
-                        result_path=result_path,
+                        image_path=os.path.basename(image_path),
+                        result_path=result_key,
                         confidence_score=float(overall_confidence),
                         prediction_result=analysis_results["prediction_result"],
-                        analysis_json=json.dumps(analysis_results),
-                        segmentation_path=segmentation_path
+                        analysis=analysis_results,
+                        segmentation_path=segmentation_path,
+                        **KeypointDetection.summary_from_analysis(analysis_results, side=side)
                     )
 
-                    # Add to database session
-                    db.session.add(new_detection)
-
-                    # Add keypoints to database
-                    for keypoint in keypoints_data:
-                        new_keypoint = Keypoint(
-                            detection_id=detection_id,
-                            label=keypoint["label"],
-                            x_coord=keypoint["x"],
-                            y_coord=keypoint["y"],
-                            confidence=keypoint["confidence"]
-                        )
-                        db.session.add(new_keypoint)
-
-                    # Commit to database
-                    db.session.commit()
+                    # Insert the detection and its keypoints, or leave them to the caller in batch mode
+                    self._store_detection(detection_values, keypoints_data, commit=commit, pending=pending)
+                    PREDICTIONS.labels(prediction_result=analysis_results["prediction_result"]).inc()
+
+                    # Render history thumbnails and previews off the request path
+                    if self.derivatives is not None:
+                        self.derivatives.schedule('uploads', image_path)
+                        if detection_values["result_path"]:
+                            self.derivatives.schedule('results', result_key, after=result_written)
+                        if detection_values["segmentation_path"]:
+                            self.derivatives.schedule(
+                                'results', segmentation_path,
+                                after=self.artifacts.pending(self.result_store, segmentation_path)
+                            )
 
                     return {
                         "status": "success",
                         "detection_id": detection_id,
                         "original_image": os.path.basename(image_path),
-                        "result_image": os.path.basename(result_path),
+                        "result_image": detection_values["result_path"],
                         "keypoints": keypoints_data,
                         "confidence_score": overall_confidence,
                         "prediction": analysis_results["prediction_result"],
@@ -318,7 +479,8 @@ class KeypointDetectionService:
             # Perform analysis for each side with an impacted canine
             combined_analysis = {}
             for side in impacted_canine_sides:
-                analysis_results = self.perform_dental_analysis(keypoints_dict, segmentation_data, side)
+                with stage('analysis'):
+                    analysis_results = self.perform_dental_analysis(keypoints_dict, segmentation_data, side)
                 combined_analysis[side] = analysis_results
 
             # Determine overall prediction from all analyses
@@ -330,51 +492,53 @@ class KeypointDetectionService:
                 elif analysis["prediction_result"] == "impacted" and final_prediction != "severely impacted":
                     final_prediction = "impacted"
 
+            # The side that decided the overall prediction supplies the summary; fields it could not
+            # determine are recorded as NO_DETECTION so the row still matches filters and rollups
+            governing_side = next(
+                (side for side, analysis in combined_analysis.items() if analysis["prediction_result"] == final_prediction),
+                impacted_canine_sides[0]
+            )
+            governing = combined_analysis[governing_side]
+            sector_analysis = governing.get("sector_analysis") or {"sector": None, "impaction_type": NO_DETECTION}
+
             combined_results = {
                 "side_analyses": combined_analysis,
-                "prediction_result": final_prediction
+                "prediction_result": final_prediction,
+                "sector_analysis": sector_analysis
             }
+            summary = KeypointDetection.summary_from_analysis(governing, side=governing_side)
+            summary["impaction_type"] = summary["impaction_type"] or NO_DETECTION
 
             # Create a single record for the overall detection
             # If we get here, no keypoints were detected or there was an issue
-            detection_id = str(int(time.time() * 1000))
+            detection_id = new_ulid()
 
             error_analysis = {
                 "error": "No valid keypoints detected",
                 "prediction_result": "unknown"
             }
 
-            # Create new detection record in database with error information
-            new_detection = KeypointDetection(
+            # Create new detection record with error information; paths are blob keys
+            detection_values = dict(
                 id=detection_id,
                 user_id=user_id,
-                image_path=image_path,
-                result_path=result_path,
+                image_path=os.path.basename(image_path),
+                result_path=result_key,
                 confidence_score=float(overall_confidence),
                 prediction_result=final_prediction,
-                analysis_json=json.dumps(combined_results),
-                segmentation_path=segmentation_path if segmentation_data and "result_image" in segmentation_data else None
+                analysis=combined_results,
+                segmentation_path=segmentation_data["result_image"] if segmentation_data and "result_image" in segmentation_data else None,
+                **summary
             )
 
-            db.session.add(new_detection)
-            # Add keypoints to database
-            for keypoint in keypoints_data:
-                new_keypoint = Keypoint(
-                    detection_id=detection_id,
-                    label=keypoint["label"],
-                    x_coord=keypoint["x"],
-                    y_coord=keypoint["y"],
-                    confidence=keypoint["confidence"]
-                )
-                db.session.add(new_keypoint)
-
-            db.session.commit()
+            self._store_detection(detection_values, keypoints_data, commit=commit, pending=pending)
+            PREDICTIONS.labels(prediction_result=final_prediction).inc()
 
             return {
                 "status": "success",
                 "detection_id": detection_id,
                 "original_image": os.path.basename(image_path),
-                "result_image": os.path.basename(result_path),
+                "result_image": detection_values["result_path"],
                 "keypoints": keypoints_data,
                 "confidence_score": overall_confidence,
                 "prediction": final_prediction,
@@ -382,11 +546,106 @@ class KeypointDetectionService:
             }
 
         except Exception as e:
-            db.session.rollback()
+            if commit and pending is None:
+                db.session.rollback()
             self.app.logger.error(f"Error in keypoint detection: {str(e)}")
             self.app.logger.error(traceback.format_exc())
             raise
 
+    def _extract_keypoints(self, result, kpts, category_names):
+        """Convert one keypoint set from the model into labelled points.
+
+        Returns (keypoints_data, keypoints_dict, overall_confidence).
+        """
+        keypoints_data = []
+        confidence_score = 0.5  # Default confidence
+        overall_confidence = 0.0
+        keypoints_count = 0
+
+        # Convert keypoints to dict for easier access
+        keypoints_dict = {}
+
+        # Check keypoint structure
+        if len(kpts.shape) == 2:
+            # Format is [num_keypoints, 2] (x, y) without confidence
+            self.app.logger.info("Keypoint format: [num_keypoints, 2] (x, y coordinates only)")
+
+            # Use a default confidence of 0.8 for detected points
+            model_confidence = float(result.boxes.conf[0]) if hasattr(result, 'boxes') and len(result.boxes) > 0 else 0.7
+
+            default_confidence = min(0.7, max(0.5, model_confidence))
+
+            overall_confidence = default_confidence
+            keypoints_count = len(kpts)
+
+            # Store keypoint data with default confidence
+            for i, kp in enumerate(kpts):
+                if i < len(category_names):
+                    label = category_names[i]
+                else:
+                    label = f"point_{i}"
+
+                keypoints_data.append({
+                    "label": label,
+                    "x": float(kp[0]),
+                    "y": float(kp[1]),
+                    "confidence": default_confidence
+                })
+
+                # Add to keypoints dict
+                keypoints_dict[label] = {
+                    "x": float(kp[0]),
+                    "y": float(kp[1]),
+                    "confidence": default_confidence
+                }
+
+        elif len(kpts.shape) >= 2 and kpts.shape[1] >= 3:
+            # Format is [num_keypoints, 3] (x, y, conf)
+            self.app.logger.info("Keypoint format: [num_keypoints, 3] (x, y, confidence)")
+
+            # Calculate overall confidence
+            confidence_sum = 0.0
+
+            # Store keypoint data with proper labels
+            for i, kp in enumerate(kpts):
+                conf = float(kp[2]) if len(kp) > 2 else 0.0
+                if conf > 0.2:  # Include points with reasonable confidence
+                    label = category_names.get(i, f"point_{i}")
+                    keypoints_data.append({
+                        "label": label,
+                        "x": float(kp[0]),
+                        "y": float(kp[1]),
+                        "confidence": float(kp[2])
+                    })
+
+                    # Add to keypoints dict
+                    keypoints_dict[label] = {
+                        "x": float(kp[0]),
+                        "y": float(kp[1]),
+                        "confidence": conf
+                    }
+
+                    confidence_sum += conf
+                    keypoints_count += 1
+
+            # Calculate average confidence
+            if keypoints_count > 0:
+                overall_confidence = confidence_sum / keypoints_count
+                expected_keypoints = len(category_names)
+                if expected_keypoints > 0:
+                    completeness_factor = min(1.0, keypoints_count / expected_keypoints)
+                    confidence_score = confidence_score * (0.7 + 0.3 * completeness_factor)
+
+                critical_points = ["m1", "m2", "r13", "c13"] 
+                missing_critical = any(point not in keypoints_dict for point in critical_points)
+                if missing_critical:
+                    confidence_score = confidence_score * 0.8
+            else:
+                confidence_score = 0.3
+
+        return keypoints_data, keypoints_dict, overall_confidence
+
+    @traced()
     def perform_dental_analysis(self, keypoints_dict, segmentation_data=None, side="right", img_width=1000):
         """
         Perform comprehensive dental analysis based on the criteria provided
@@ -830,6 +1089,79 @@ class KeypointDetectionService:
 
         return overlap_area
 
+    def _keypoint_labels(self):
+        """Label map in model output order and its version, loaded once"""
+        if self._labels is None:
+            names = self._get_category_names()
+            labels = [names[i] for i in sorted(names)]
+            self._labels = (labels, label_version(labels))
+        return self._labels
+
+    def packed_current(self, detection):
+        """Whether the packed column can be read directly, i.e. exists and matches the label map"""
+        return detection.keypoints_packed is not None and detection.keypoints_version == self._keypoint_labels()[1]
+
+    def get_keypoints(self, detection, rows=None):
+        """Keypoint dicts for a detection, from the packed column when it matches the label map.
+
+        Otherwise they come from rows, the detection's keypoints table rows, which
+        are loaded lazily when not given.
+        """
+        if self.packed_current(detection):
+            labels, _ = self._keypoint_labels()
+            return keypoints_from_array(unpack_keypoints(detection.keypoints_packed, labels), labels)
+
+        # Written before packing, or under an older label map; `flask keypoints-repack` converts these
+        return self._row_keypoints(detection.keypoints if rows is None else rows)
+
+    def _row_keypoints(self, rows):
+        return [{"label": kp.label, "x": kp.x_coord, "y": kp.y_coord, "confidence": kp.confidence} for kp in rows]
+
+    def repack_keypoints(self, batch_size=1000):
+        """Pack the keypoints of detections stored as rows only or under an older label map.
+
+        Commits per batch and returns the number of detections repacked.
+        """
+        labels, version = self._keypoint_labels()
+        stale = db.or_(KeypointDetection.keypoints_packed.is_(None), KeypointDetection.keypoints_version != version)
+        repacked = 0
+        last_id = ''
+
+        while True:
+            ids = [
+                detection_id for detection_id, in db.session.query(KeypointDetection.id)
+                .filter(KeypointDetection.id > last_id, stale)
+                .order_by(KeypointDetection.id)
+                .limit(batch_size)
+            ]
+            if not ids:
+                return repacked
+
+            # Only rows can be repacked; an array packed under another label map cannot be decoded
+            rows = self._keypoint_rows(ids)
+            updates = [
+                {
+                    'id': detection_id,
+                    'keypoints_packed': pack_keypoints(self._row_keypoints(keypoints), labels),
+                    'keypoints_version': version
+                }
+                for detection_id, keypoints in rows.items()
+            ]
+            if updates:
+                db.session.execute(db.update(KeypointDetection), updates)
+            db.session.commit()
+            repacked += len(updates)
+            last_id = ids[-1]
+
+    def _keypoint_rows(self, detection_ids):
+        """Keypoints table rows for several detections in one query, by detection id"""
+        rows = {}
+        if detection_ids:
+            query = Keypoint.query.filter(Keypoint.detection_id.in_(detection_ids)).order_by(Keypoint.id)
+            for keypoint in query:
+                rows.setdefault(keypoint.detection_id, []).append(keypoint)
+        return rows
+
     def _get_category_names(self):
         """Load category names from notes.json or use defaults"""
         try:
@@ -855,80 +1187,163 @@ class KeypointDetectionService:
     def get_detection_by_id(self, detection_id):
         """Retrieve a specific detection by ID from database"""
         try:
-            # ดึงข้อมูลจากฐานข้อมูล
-            detection = KeypointDetection.query.get(detection_id)
+            # ดึงข้อมูลจากฐานข้อมูล พร้อม keypoints ใน query เดียว
+            result = self.get_detections_by_ids([detection_id]).get(detection_id)
 
-            if not detection:
+            if not result:
                 self.app.logger.error(f"Detection with ID {detection_id} not found")
                 return None
 
-            # สร้าง dictionary จากข้อมูลที่ได้
-            result = detection.to_dict()
+            return result
 
-            # ดึง keypoints สำหรับ detection นี้
-            keypoints = Keypoint.query.filter_by(detection_id=detection_id).all()
-            keypoints_data = []
+        except Exception as e:
+            self.app.logger.error(f"Error retrieving detection: {str(e)}")
+            self.app.logger.error(traceback.format_exc())
+            return None
 
-            for kp in keypoints:
-                keypoints_data.append({
-                    "label": kp.label,
-                    "x": kp.x_coord,
-                    "y": kp.y_coord,
-                    "confidence": kp.confidence
-                })
+    def get_detections_by_ids(self, detection_ids, user_id=None):
+        """Fetch several detections with their keypoints.
 
-            result["keypoints"] = keypoints_data
+        Keypoints come from the packed column; only detections without a current
+        packed array need the keypoints table, read for all of them in one more
+        query. Returns a dict of detection id -> detection dict; unknown IDs (and,
+        when user_id is given, other users' detections) are left out.
+        """
+        query = KeypointDetection.query.filter(KeypointDetection.id.in_(detection_ids))
+        if user_id is not None:
+            query = query.filter(KeypointDetection.user_id == user_id)
 
-            # แปลงข้อมูล analysis_json เป็น dictionary (ถ้ามี)
-            if hasattr(detection, 'analysis_json') and detection.analysis_json:
-                try:
-                    result["analysis"] = json.loads(detection.analysis_json)
-                except:
-                    result["analysis"] = None
+        detections = query.all()
+        rows = self._keypoint_rows([detection.id for detection in detections if not self.packed_current(detection)])
+        return {detection.id: self._detection_dict(detection, rows.get(detection.id, [])) for detection in detections}
 
-            # เพิ่มข้อมูล segmentation ถ้ามี
-            if hasattr(detection, 'segmentation_path') and detection.segmentation_path:
-                result["segmentation"] = {
-                    "result_image": os.path.basename(detection.segmentation_path)
-                }
+    def _detection_dict(self, detection, keypoint_rows=None):
+        """Full detection with keypoints and analysis, as served by /detection/<id>"""
+        result = detection.to_dict(include_keypoints=False)
 
-            return result
+        # ดึง keypoints สำหรับ detection นี้
+        result["keypoints"] = self.get_keypoints(detection, keypoint_rows)
 
-        except Exception as e:
-            self.app.logger.error(f"Error retrieving detection: {str(e)}")
-            self.app.logger.error(traceback.format_exc())
-            return None
+        # เพิ่มข้อมูล segmentation ถ้ามี
+        if detection.segmentation_path:
+            result["segmentation"] = {
+                "result_image": os.path.basename(detection.segmentation_path)
+            }
 
-    def get_user_history(self, user_id):
-        """Get detection history for a specific user from database"""
-        try:
-            # Get all detections for the user, ordered by creation date (newest first)
-            detections = KeypointDetection.query.filter_by(user_id=user_id).order_by(KeypointDetection.created_at.desc()).all()
-
-            # Convert to dictionaries and format for frontend
-            results = []
-            for detection in detections:
-                detection_dict = {
-                    'id': detection.id,
-                    'user_id': detection.user_id,
-                    'image_path': detection.image_path,
-                    'result_path': detection.result_path,
-                    'confidence_score': detection.confidence_score,
-                    'prediction_result': detection.prediction_result,
-                    'created_at': detection.created_at.isoformat()
-                }
+        return result
 
-                # Add analysis data if available
-                if hasattr(detection, 'analysis_json') and detection.analysis_json:
-                    try:
-                        detection_dict['analysis'] = json.loads(detection.analysis_json)
-                    except:
-                        detection_dict['analysis'] = None
+    def get_user_history(self, user_id, cursor=None, limit=50):
+        """Get one page of a user's detection history, newest first.
 
-                results.append(detection_dict)
+        Returns (detections, next_cursor); next_cursor is None on the last page.
+        Raises ValueError for a malformed cursor.
+        """
+        after = decode_cursor(cursor) if cursor else None
 
-            return results
+        try:
+            query = self._summary_query().filter(KeypointDetection.user_id == user_id)
+            return self._summary_page(query, after, limit)
 
         except Exception as e:
             self.app.logger.error(f"Error retrieving user history: {str(e)}")
-            return []
+            return [], None
+
+    def search_detections(self, user_id=None, sector=None, impaction_type=None, prediction=None, angles=None,
+                          created_from=None, created_to=None, cursor=None, limit=50):
+        """Find detections by analysis fields, newest first, one page at a time.
+
+        user_id=None searches every user. angles maps an angle name from
+        ANALYSIS_ANGLES to a (min, max) pair, either end may be None.
+        Returns (detections, next_cursor); raises ValueError for bad arguments.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        query = self._summary_query()
+
+        if user_id is not None:
+            query = query.filter(KeypointDetection.user_id == user_id)
+
+        # Containment on the analysis document is served by the GIN index
+        sector_analysis = {}
+        if sector is not None:
+            sector_analysis['sector'] = sector
+        if impaction_type:
+            sector_analysis['impaction_type'] = impaction_type
+        document = {}
+        if sector_analysis:
+            document['sector_analysis'] = sector_analysis
+        if prediction:
+            document['prediction_result'] = prediction
+        if document:
+            query = query.filter(KeypointDetection.analysis.contains(document))
+
+        for name, (low, high) in (angles or {}).items():
+            expression = analysis_angle(name)
+            if low is not None:
+                query = query.filter(expression >= low)
+            if high is not None:
+                query = query.filter(expression <= high)
+
+        if created_from is not None:
+            query = query.filter(KeypointDetection.created_at >= created_from)
+        if created_to is not None:
+            query = query.filter(KeypointDetection.created_at < created_to)
+
+        return self._summary_page(query, after, limit)
+
+    def _summary_query(self):
+        """Detections with only the list columns loaded; the analysis is served by /detection/<id>"""
+        return KeypointDetection.query.options(load_only(
+            KeypointDetection.id,
+            KeypointDetection.user_id,
+            KeypointDetection.image_path,
+            KeypointDetection.result_path,
+            KeypointDetection.confidence_score,
+            KeypointDetection.prediction_result,
+            KeypointDetection.created_at,
+            KeypointDetection.side,
+            KeypointDetection.sector,
+            KeypointDetection.impaction_type,
+            KeypointDetection.difficult_factors,
+            KeypointDetection.keypoint_coverage
+        ))
+
+    def _summary_page(self, query, after, limit):
+        """Run a keyset-paginated query on (created_at, id); return (items, next_cursor)"""
+        if after:
+            query = query.filter(tuple_(KeypointDetection.created_at, KeypointDetection.id) < tuple_(*after))
+        detections = query.order_by(
+            KeypointDetection.created_at.desc(),
+            KeypointDetection.id.desc()
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(detections) > limit:
+            detections = detections[:limit]
+            next_cursor = encode_cursor(detections[-1].created_at, detections[-1].id)
+
+        return [self._summary_item(detection) for detection in detections], next_cursor
+
+    def _summary_item(self, detection):
+        """Format one detection for history and search lists"""
+        detection_dict = {
+            'id': detection.id,
+            'user_id': detection.user_id,
+            'image_path': detection.image_path,
+            'result_path': detection.result_path,
+            'confidence_score': detection.confidence_score,
+            'prediction_result': detection.prediction_result,
+            'created_at': detection.created_at.isoformat(),
+            **detection.summary_dict()
+        }
+
+        # Small derivatives so history views never fetch the full-size images
+        if self.derivatives is not None:
+            image_urls = self.derivatives.urls('uploads', detection.image_path)
+            detection_dict['thumbnail_url'] = image_urls['thumb']
+            detection_dict['preview_url'] = image_urls['preview']
+            if detection.result_path:
+                result_urls = self.derivatives.urls('results', detection.result_path)
+                detection_dict['result_thumbnail_url'] = result_urls['thumb']
+                detection_dict['result_preview_url'] = result_urls['preview']
+
+        return detection_dict
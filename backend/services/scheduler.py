@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from utils.metrics import INFERENCE_QUEUE_DEPTH, INFERENCE_QUEUE_TIME
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+class InferenceScheduler:
+    """Admission control for model calls with interactive and bulk priority classes.
+
+    /analyze/batch queues its model calls as bulk work, so single uploads
+    served by the same worker go ahead of it. Arbitration is per process:
+    each gunicorn worker and each CLI command (e.g. `flask ingest-folder`) has
+    its own scheduler and its own model copy, so a bulk job in a separate
+    process is not held back by interactive uploads. Run such jobs on separate
+    hardware, or at off-peak times when they share a GPU with the API.
+    """
+
+    def __init__(self, concurrency=1, policy='weighted', weights=None, starvation_seconds=30.0):
+        self.concurrency = concurrency
+        self.policy = policy
+        self.weights = weights or {INTERACTIVE: 4, BULK: 1}
+        self.starvation_seconds = starvation_seconds
+
+        self._lock = threading.Lock()
+        self._queues = {name: deque() for name in PRIORITY_CLASSES}
+        self._credits = dict(self.weights)
+        self._running = 0
+        self._stats = {
+            name: {"completed": 0, "queue_time_total": 0.0, "queue_time_max": 0.0, "starvation_promotions": 0}
+            for name in PRIORITY_CLASSES
+        }
+
+    def init_app(self, app):
+        self.concurrency = max(1, int(app.config.get('INFERENCE_CONCURRENCY', self.concurrency)))
+        self.policy = app.config.get('INFERENCE_SCHEDULING_POLICY', self.policy)
+        self.weights = {
+            INTERACTIVE: max(1, int(app.config.get('INFERENCE_INTERACTIVE_WEIGHT', self.weights[INTERACTIVE]))),
+            BULK: max(1, int(app.config.get('INFERENCE_BULK_WEIGHT', self.weights[BULK])))
+        }
+        self.starvation_seconds = float(app.config.get('INFERENCE_STARVATION_SECONDS', self.starvation_seconds))
+        self._credits = dict(self.weights)
+
+        if self.policy not in ('weighted', 'strict'):
+            app.logger.warning(f"Unknown inference scheduling policy '{self.policy}', using 'weighted'")
+            self.policy = 'weighted'
+
+        app.logger.info(
+            f"Inference scheduler: policy={self.policy}, concurrency={self.concurrency}, "
+            f"weights={self.weights}, starvation_seconds={self.starvation_seconds}"
+        )
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Block until a model slot is granted to this priority class, then hold it"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        waiter = {"event": threading.Event(), "enqueued_at": time.monotonic(), "priority": priority}
+
+        INFERENCE_QUEUE_DEPTH.labels(priority=priority).inc()
+        with self._lock:
+            self._queues[priority].append(waiter)
+            self._dispatch()
+
+        waiter["event"].wait()
+        queue_time = time.monotonic() - waiter["enqueued_at"]
+        INFERENCE_QUEUE_DEPTH.labels(priority=priority).dec()
+        INFERENCE_QUEUE_TIME.labels(priority=priority).observe(queue_time)
+
+        with self._lock:
+            stats = self._stats[priority]
+            stats["queue_time_total"] += queue_time
+            stats["queue_time_max"] = max(stats["queue_time_max"], queue_time)
+
+        try:
+            yield queue_time
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats[priority]["completed"] += 1
+                self._dispatch()
+
+    def run(self, fn, *args, priority=INTERACTIVE, **kwargs):
+        """Run fn(*args, **kwargs) once a slot for the priority class is available"""
+        with self.slot(priority):
+            return fn(*args, **kwargs)
+
+    def _dispatch(self):
+        # Caller must hold self._lock
+        while self._running < self.concurrency:
+            priority = self._next_class()
+            if priority is None:
+                return
+
+            waiter = self._queues[priority].popleft()
+            self._running += 1
+            waiter["event"].set()
+
+    def _next_class(self):
+        interactive = self._queues[INTERACTIVE]
+        bulk = self._queues[BULK]
+
+        if not interactive and not bulk:
+            return None
+        if not bulk:
+            return INTERACTIVE
+        if not interactive:
+            return BULK
+
+        # Starvation protection: bulk work that has waited too long goes next
+        if time.monotonic() - bulk[0]["enqueued_at"] >= self.starvation_seconds:
+            self._stats[BULK]["starvation_promotions"] += 1
+            return BULK
+
+        if self.policy == 'strict':
+            return INTERACTIVE
+
+        # Weighted round robin between the two classes
+        if self._credits[INTERACTIVE] <= 0 and self._credits[BULK] <= 0:
+            self._credits = dict(self.weights)
+
+        if self._credits[INTERACTIVE] > 0:
+            self._credits[INTERACTIVE] -= 1
+            return INTERACTIVE
+
+        self._credits[BULK] -= 1
+        return BULK
+
+    def stats(self):
+        """Return per-class queue depths and queue-time metrics"""
+        with self._lock:
+            now = time.monotonic()
+            result = {
+                "policy": self.policy,
+                "concurrency": self.concurrency,
+                "running": self._running,
+                "classes": {}
+            }
+
+            for name in PRIORITY_CLASSES:
+                stats = self._stats[name]
+                queue = self._queues[name]
+                completed = stats["completed"]
+                result["classes"][name] = {
+                    "queued": len(queue),
+                    "oldest_wait_seconds": now - queue[0]["enqueued_at"] if queue else 0.0,
+                    "completed": completed,
+                    "queue_time_avg_seconds": stats["queue_time_total"] / completed if completed else 0.0,
+                    "queue_time_max_seconds": stats["queue_time_max"],
+                    "starvation_promotions": stats["starvation_promotions"]
+                }
+
+            return result
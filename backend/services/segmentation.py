@@ -1,5 +1,4 @@
 import os
-import uuid
 import cv2
 import numpy as np
 import json
@@ -9,23 +8,32 @@ from pathlib import Path
 from PIL import Image
 import torch
 from datetime import datetime
+from .scheduler import INTERACTIVE
+from .fake_model import FakeYOLO
+from .storage import BlobStore
+from .artifacts import ArtifactWriter
+from utils.tracing import traced
+from utils.metrics import stage
 
 class SegmentationService:
-    def __init__(self, app=None):
+    def __init__(self, app=None, scheduler=None, result_store=None, artifacts=None):
         self.app = app
         self.model = None
-        self.upload_folder = os.path.join(os.getcwd(), 'uploads')
-        self.results_folder = os.path.join(os.getcwd(), 'results')
-
-        # Ensure directories exist
-        os.makedirs(self.upload_folder, exist_ok=True)
-        os.makedirs(self.results_folder, exist_ok=True)
+        self.scheduler = scheduler
+        self.result_store = result_store or BlobStore('results')
+        self.artifacts = artifacts or ArtifactWriter()
 
         if app:
             self.init_app(app)
 
     def init_app(self, app):
         self.app = app
+        # Local stand-in for load tests and benchmarks, never downloads weights
+        if app.config.get('MODEL_BACKEND') == 'fake':
+            self.model = FakeYOLO.from_config(app.config, task='segment')
+            app.logger.info("Using fake segmentation model backend")
+            return
+
         # Load YOLO segmentation model
         try:
             model_path = app.config.get('SEGMENTATION_MODEL_PATH', 'models/segmentation/best.pt')
@@ -40,7 +48,18 @@ class SegmentationService:
             except:
                 app.logger.error("Could not load any YOLO segmentation model")
 
-    def get_tooth_segmentation(self, image_path):
+    def _predict(self, image, priority=INTERACTIVE):
+        """Run the segmentation model through the inference scheduler"""
+        if self.scheduler is None:
+            with stage('segmentation_inference'):
+                return self.model(image, verbose=False)
+
+        with self.scheduler.slot(priority):
+            with stage('segmentation_inference'):
+                return self.model(image, verbose=False)
+
+    @traced()
+    def get_tooth_segmentation(self, image_path, priority=INTERACTIVE):
         """Process image with YOLO segmentation and return segmentation masks"""
         try:
             # Check if model is loaded
@@ -51,16 +70,52 @@ class SegmentationService:
             # Load image
             image = Image.open(image_path)
 
-            # Run inference
-            results = self.model(image, verbose=False)
+            # Run inference, waiting behind higher priority work if needed
+            results = self._predict(image, priority)
+
+        except Exception as e:
+            self.app.logger.error(f"Error in segmentation: {str(e)}")
+            self.app.logger.error(traceback.format_exc())
+            raise
+
+        return self._process_results(results)
+
+    @traced()
+    def get_tooth_segmentation_batch(self, image_paths, priority=INTERACTIVE, images=None):
+        """Segment several images with a single model call.
 
-            # Generate unique filename for results
-            result_filename = f"{uuid.uuid4().hex}_seg_result.jpg"
-            result_path = os.path.join(self.results_folder, result_filename)
+        Returns one result dict per image, in input order. A failure on one image
+        is reported as an error entry and does not abort the rest of the batch.
+        Already decoded images (BGR arrays) can be passed to skip loading from disk.
+        """
+        if self.model is None:
+            self.app.logger.error("YOLO segmentation model not loaded")
+            raise ValueError("Segmentation model not initialized")
 
-            # Plot results
-            result_image = results[0].plot()
-            cv2.imwrite(result_path, result_image)
+        if images is None:
+            images = [Image.open(image_path) for image_path in image_paths]
+        results = self._predict(images, priority)
+
+        outputs = []
+        for result in results:
+            try:
+                outputs.append(self._process_results([result]))
+            except Exception as e:
+                self.app.logger.error(f"Error in segmentation: {str(e)}")
+                outputs.append({
+                    "status": "error",
+                    "message": str(e)
+                })
+
+        return outputs
+
+    def _process_results(self, results):
+        """Render the overlay and extract tooth polygons for a single image"""
+        try:
+            # Plot results; encoding and writing the overlay happen on the artifact writer
+            with stage('plot_imwrite'):
+                result_image = results[0].plot()
+                result_key, _ = self.artifacts.submit(self.result_store, result_image)
 
             # Process segmentation results
             segmentation_data = []
@@ -77,34 +132,19 @@ class SegmentationService:
                 # Debug info
                 self.app.logger.info(f"Found {len(masks)} masks")
 
-                for i, (mask, box) in enumerate(zip(masks, boxes)):
+                # Move all masks to host memory in one copy instead of one per mask
+                mask_arrays = masks.data.cpu().numpy()
+
+                for i, (mask_array, box) in enumerate(zip(mask_arrays, boxes)):
                     # Get class information
                     class_id = int(box.cls.item())
                     confidence = float(box.conf.item())
 
-                    # Get mask as numpy array
-                    mask_array = mask.data.cpu().numpy().squeeze()
-
                     # Convert mask to polygon for easier processing
-                    contours, _ = cv2.findContours(
-                        (mask_array * 255).astype(np.uint8),
-                        cv2.RETR_EXTERNAL,
-                        cv2.CHAIN_APPROX_SIMPLE
-                    )
-
-                    if contours:
-                        largest_contour = max(contours, key=cv2.contourArea)
-                        polygon = largest_contour.flatten().tolist()
-
-                        # Normalize coordinates
-                        img_height, img_width = mask_array.shape
-                        normalized_polygon = []
-                        for j in range(0, len(polygon), 2):
-                            normalized_polygon.append(polygon[j] / img_width)    # x
-                            normalized_polygon.append(polygon[j+1] / img_height) # y
-
-                        # Get area
-                        area = cv2.contourArea(largest_contour)
+                    polygon_data = self._mask_to_polygon(mask_array)
+
+                    if polygon_data:
+                        normalized_polygon, area = polygon_data
 
                         # Get bounding box
                         x1, y1, x2, y2 = map(float, box.xyxy[0].tolist())
@@ -139,7 +179,7 @@ class SegmentationService:
             # Add sides to the return data - ย้าย return ออกมานอก if
             return {
                 "status": "success",
-                "result_image": os.path.basename(result_path),
+                "result_image": result_key,
                 "segmentations": segmentation_data,
                 "left_teeth": left_teeth,
                 "right_teeth": right_teeth
@@ -150,6 +190,32 @@ class SegmentationService:
             self.app.logger.error(traceback.format_exc())
             raise
 
+    def _mask_to_polygon(self, mask_array):
+        """Return the normalized polygon and area of the largest region in a mask"""
+        contours, _ = cv2.findContours(
+            (mask_array * 255).astype(np.uint8),
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE
+        )
+
+        if not contours:
+            return None
+
+        largest_contour = max(contours, key=cv2.contourArea)
+        polygon = largest_contour.flatten().tolist()
+
+        # Normalize coordinates
+        img_height, img_width = mask_array.shape
+        normalized_polygon = []
+        for j in range(0, len(polygon), 2):
+            normalized_polygon.append(polygon[j] / img_width)    # x
+            normalized_polygon.append(polygon[j+1] / img_height) # y
+
+        # Get area
+        area = cv2.contourArea(largest_contour)
+
+        return normalized_polygon, area
+
     def _get_category_names(self):
         """Load category names from notes.json or use defaults"""
         try:
@@ -0,0 +1,463 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Blob keys are "<sha256>.<ext>" for content-addressed blobs or "<160-bit random hex>.<ext>"
+# for write-once artifacts whose key is assigned before they are encoded. Anything else is a
+# legacy flat filename; those were "<uuid4 hex>[_result].jpg", so no artifact key can match one
+KEY_PATTERN = re.compile(r'^([0-9a-f]{64}|[0-9a-f]{40})\.[a-z0-9]+$')
+
+# Random bytes in an artifact key: 40 hex digits, never the 32 of a legacy uuid4 filename
+ARTIFACT_KEY_BYTES = 20
+
+# Pillow format name -> stored file extension
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp'
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+# Where storage GC moves orphaned objects before they are deleted for good
+QUARANTINE_PREFIX = '.quarantine'
+
+class StorageBackend:
+    """Where blob bytes live. Object names are relative paths such as "ab/cd/<key>"."""
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def open(self, name):
+        """Return a readable binary stream"""
+        raise NotImplementedError
+
+    def put_file(self, local_path, name, fsync=False):
+        """Store a local file under name; the local file is consumed"""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def quarantine(self, name):
+        """Move name under the .quarantine/ prefix instead of deleting it"""
+        raise NotImplementedError
+
+    def touch(self, name):
+        """Mark an existing object as recently used so storage GC leaves it alone"""
+
+    def iter_objects(self, prefix=''):
+        """Yield (name, size, mtime) for stored objects, without building a full listing.
+
+        Hidden prefixes (staging, cache, quarantine) are skipped unless asked for explicitly.
+        """
+        raise NotImplementedError
+
+    def local_path(self, name):
+        """Return a filesystem path for name when the backend is local, otherwise None"""
+        return None
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return os.path.isfile(self._path(name))
+
+    def open(self, name):
+        return open(self._path(name), 'rb')
+
+    def put_file(self, local_path, name, fsync=False):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same filesystem, so readers see either nothing or the whole file
+        os.replace(local_path, path)
+
+        if fsync:
+            # Persist the rename itself, not just the file contents
+            fd = os.open(os.path.dirname(path), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, name):
+        try:
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def quarantine(self, name):
+        target = self._path(os.path.join(QUARANTINE_PREFIX, name))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self._path(name), target)
+        # The grace period before purging runs from the move, not from the last use
+        os.utime(target)
+
+    def iter_objects(self, prefix=''):
+        # Depth-first scandir keeps only one directory listing in memory at a time
+        if prefix and not os.path.isdir(self._path(prefix)):
+            return
+        stack = [prefix]
+        while stack:
+            relative = stack.pop()
+            with os.scandir(os.path.join(self.root, relative)) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    name = os.path.join(relative, entry.name) if relative else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        yield name, stat.st_size, stat.st_mtime
+
+    def local_path(self, name):
+        path = self._path(name)
+        return path if os.path.isfile(path) else None
+
+class S3Storage(StorageBackend):
+    """S3-compatible object storage; S3_ENDPOINT_URL points it at MinIO or another stand-in"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 multipart_threshold=16 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        # Files above the threshold are uploaded and downloaded in parallel parts
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize
+        )
+
+    def _key(self, name):
+        return f"{self.prefix}{name}"
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def open(self, name):
+        # StreamingBody reads from the socket on demand
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(name))['Body']
+
+    def upload(self, local_path, name):
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.client.upload_file(
+            local_path, self.bucket, self._key(name),
+            ExtraArgs={'ContentType': content_type},
+            Config=self.transfer_config
+        )
+
+    def put_file(self, local_path, name, fsync=False):
+        # An acknowledged S3 PUT is already durable
+        self.upload(local_path, name)
+        os.remove(local_path)
+
+    def download(self, name, local_path):
+        self.client.download_file(self.bucket, self._key(name), local_path, Config=self.transfer_config)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def touch(self, name):
+        # S3 cannot set LastModified directly; copying an object onto itself restamps it
+        from botocore.exceptions import ClientError
+        key = self._key(name)
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=key,
+                CopySource={'Bucket': self.bucket, 'Key': key},
+                MetadataDirective='REPLACE',
+                ContentType=mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+
+    def quarantine(self, name):
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(f"{QUARANTINE_PREFIX}/{name}"),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(name)}
+        )
+        self.delete(name)
+
+    def iter_objects(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(self.prefix):]
+                if not prefix and name.startswith(QUARANTINE_PREFIX + '/'):
+                    continue
+                yield name, obj['Size'], obj['LastModified'].timestamp()
+
+class ReadThroughCache:
+    """Bounded local copies of remote blobs, evicting the least recently used first"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Pick up files left by earlier runs or other workers, oldest access first
+        found = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.part'):
+                    continue
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                found.append((stat.st_atime, os.path.relpath(path, self.root), stat.st_size))
+
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def get(self, name):
+        path = self.path(name)
+        with self._lock:
+            if os.path.exists(path):
+                if name not in self._entries:
+                    # Downloaded by another worker sharing the directory
+                    self._entries[name] = os.path.getsize(path)
+                    self._size += self._entries[name]
+                self._entries.move_to_end(name)
+                return path
+            if name in self._entries:
+                # Evicted by another worker sharing the directory
+                self._size -= self._entries.pop(name)
+        return None
+
+    def add(self, name, local_path):
+        """Move a local file into the cache and return its cached path"""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(local_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._size += size
+            self._evict()
+        return path
+
+    def fetch(self, name, backend):
+        """Return a local path for name, downloading it from the backend on a miss"""
+        path = self.get(name)
+        if path is not None:
+            return path
+
+        if not backend.exists(name):
+            return None
+
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        os.close(fd)
+        try:
+            backend.download(name, temp_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return self.add(name, temp_path)
+
+    def _evict(self):
+        # Caller must hold self._lock
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+class BlobStore:
+    """Content-addressed blob store with two-level hash sharding.
+
+    A blob with key "abcdef...jpg" is stored as "ab/cd/abcdef...jpg" on the
+    configured backend, so no directory or prefix grows past a few thousand
+    entries. Identical content maps to the same key and is stored once. Files
+    written before the store existed sit directly in the root and are still
+    found by path().
+
+    Writes are staged in <root>/.tmp and handed to the backend once complete.
+    With a remote backend, reads go through a bounded local cache.
+    """
+
+    def __init__(self, name, config_key=None, root=None):
+        self.name = name
+        self.config_key = config_key
+        self.cache = None
+        self.configure(root or os.path.join(os.getcwd(), name))
+
+    def init_app(self, app):
+        root = app.config.get(self.config_key) if self.config_key else None
+        if root:
+            self.configure(root)
+
+        if app.config.get('STORAGE_BACKEND', 'local') == 's3':
+            self.backend = S3Storage(
+                bucket=app.config['S3_BUCKET'],
+                prefix=f"{app.config.get('S3_PREFIX', '')}{self.name}/",
+                endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+                region=app.config.get('S3_REGION'),
+                multipart_threshold=app.config.get('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024),
+                multipart_chunksize=app.config.get('S3_MULTIPART_CHUNKSIZE', 16 * 1024 * 1024)
+            )
+            self.cache = ReadThroughCache(
+                os.path.join(self.root, '.cache'),
+                app.config.get('STORAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+            )
+            app.logger.info(f"Blob store '{self.name}' on s3://{app.config['S3_BUCKET']}/{self.backend.prefix}")
+
+    def configure(self, root):
+        """Keep blobs on the local filesystem under root"""
+        self.root = root
+        self.backend = LocalStorage(root)
+        self.cache = None
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    @property
+    def temp_dir(self):
+        return os.path.join(self.root, '.tmp')
+
+    def object_name(self, key):
+        if KEY_PATTERN.match(key):
+            return f"{key[0:2]}/{key[2:4]}/{key}"
+        return key
+
+    def _valid_key(self, key):
+        return bool(key) and os.path.basename(key) == key and not key.startswith('.')
+
+    def path(self, key):
+        """Return a local file path for a key or legacy filename, or None if it does not exist"""
+        if not self._valid_key(key):
+            return None
+
+        name = self.object_name(key)
+        if self.cache is not None:
+            return self.cache.fetch(name, self.backend)
+        return self.backend.local_path(name)
+
+    def exists(self, key):
+        return self._valid_key(key) and self.backend.exists(self.object_name(key))
+
+    def open(self, key):
+        """Return a readable binary stream for a key"""
+        if self.cache is not None:
+            path = self.cache.get(self.object_name(key))
+            if path is not None:
+                return open(path, 'rb')
+        return self.backend.open(self.object_name(key))
+
+    def put_stream(self, stream, ext, sha256=None):
+        """Copy a file-like object into the store, hashing it in the same pass, and return its key.
+
+        When the caller already knows the SHA-256 hex digest, content that is
+        already stored is not copied at all.
+        """
+        if sha256 is not None:
+            key = f"{sha256}.{ext}"
+            if self.backend.exists(self.object_name(key)):
+                self.backend.touch(self.object_name(key))
+                return key
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if sha256 is None:
+                        digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(temp_path, f"{sha256 or digest.hexdigest()}.{ext}")
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put_bytes(self, data, ext, key=None, fsync=False):
+        """Store an in-memory blob and return its key.
+
+        The key defaults to the content hash; a pre-assigned write-once key can be given instead.
+        """
+        if key is None:
+            key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+            if self.backend.exists(self.object_name(key)):
+                self.backend.touch(self.object_name(key))
+                return key
+
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return self._commit(temp_path, key, fsync=fsync)
+
+    def put_file(self, source_path, ext, move=False):
+        """Store a file that is already on disk and return its key.
+
+        With move=True the source is renamed into place (or removed when the
+        content is already stored) instead of copied.
+        """
+        if not move:
+            with open(source_path, 'rb') as f:
+                return self.put_stream(f, ext)
+
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return self._commit(source_path, f"{digest.hexdigest()}.{ext}")
+
+    def _commit(self, temp_path, key, fsync=False):
+        """Hand a fully written file to the backend, or drop it if the blob already exists"""
+        name = self.object_name(key)
+        if self.backend.exists(name):
+            # Deduplicated: refresh the timestamp so storage GC treats it as new
+            self.backend.touch(name)
+            os.remove(temp_path)
+            return key
+
+        if self.cache is not None:
+            # Keep the local copy cached so the model can read it without a round trip
+            self.backend.upload(temp_path, name)
+            self.cache.add(name, temp_path)
+        else:
+            self.backend.put_file(temp_path, name, fsync=fsync)
+        return key
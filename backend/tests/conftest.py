@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+# Run from the backend directory, like the app and the benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import db  # noqa: E402
+
+@pytest.fixture
+def app(tmp_path):
+    """Bare app on a throwaway SQLite database, the same setup as benchmarks/run.py"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def user(app):
+    from models import User
+
+    user = User(username='clinician', email='clinician@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
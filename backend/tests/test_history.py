@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import db
+from models import KeypointDetection
+from services import keypoint_service
+from utils.ids import new_ulid
+from utils.pagination import encode_cursor, decode_cursor
+
+@pytest.fixture
+def service(app, monkeypatch):
+    monkeypatch.setattr(keypoint_service, 'app', app)
+    return keypoint_service
+
+@pytest.fixture
+def detections(user):
+    """Seven detections; three share a timestamp so ordering falls back to the id"""
+    base = datetime(2026, 10, 1, 12, 0, 0)
+    created = [base, base + timedelta(minutes=1), base + timedelta(minutes=1), base + timedelta(minutes=1),
+               base + timedelta(minutes=2), base + timedelta(minutes=3), base + timedelta(minutes=4)]
+    rows = [
+        KeypointDetection(id=new_ulid(), user_id=user.id, image_path=f'{i}.png', created_at=created_at)
+        for i, created_at in enumerate(created)
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)
+
+def _all_pages(service, user_id, limit):
+    pages = []
+    cursor = None
+    while True:
+        items, cursor = service.get_user_history(user_id, cursor=cursor, limit=limit)
+        pages.append(items)
+        if cursor is None:
+            return pages
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 50])
+def test_pages_cover_every_row_once_newest_first(service, user, detections, limit):
+    pages = _all_pages(service, user.id, limit)
+    ids = [item['id'] for page in pages for item in page]
+
+    assert ids == [row.id for row in detections]
+    assert all(len(page) <= limit for page in pages)
+
+def test_last_page_has_no_cursor(service, user, detections):
+    items, cursor = service.get_user_history(user.id, limit=len(detections))
+
+    assert len(items) == len(detections)
+    assert cursor is None
+
+def test_cursor_resumes_inside_a_timestamp_tie(service, user, detections):
+    # detections[4] is the middle of the three rows created in the same minute
+    tied = detections[4]
+    items, _ = service.get_user_history(user.id, cursor=encode_cursor(tied.created_at, tied.id), limit=50)
+
+    assert [item['id'] for item in items] == [row.id for row in detections[5:]]
+
+def test_history_is_scoped_to_the_user(service, user, detections):
+    from models import User
+
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add(other)
+    db.session.commit()
+
+    assert service.get_user_history(other.id) == ([], None)
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 1, 12, 0, 0, 123456)
+    row_id = new_ulid()
+
+    assert decode_cursor(encode_cursor(created_at, row_id)) == (created_at, row_id)
+
+def test_malformed_cursor_is_rejected(service, user):
+    with pytest.raises(ValueError):
+        service.get_user_history(user.id, cursor='not-a-cursor')
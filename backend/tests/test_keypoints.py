@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from config import db
+from services import keypoint_service
+from utils.ids import new_ulid
+from utils.keypoints import label_version, pack_keypoints, unpack_keypoints, keypoints_from_array
+
+LABELS = ['c11', 'c12', 'm1', 'r11']
+
+KEYPOINTS = [
+    {'label': 'm1', 'x': 412.5, 'y': 98.25, 'confidence': 0.875},
+    {'label': 'c11', 'x': 10.0, 'y': 20.5, 'confidence': 0.5}
+]
+
+def _by_label(keypoints):
+    return {keypoint['label']: keypoint for keypoint in keypoints}
+
+def test_pack_round_trip_keeps_present_labels():
+    array = unpack_keypoints(pack_keypoints(KEYPOINTS, LABELS), LABELS)
+
+    assert array.shape == (len(LABELS), 3)
+    assert math.isnan(array[LABELS.index('r11')][0])
+    assert _by_label(keypoints_from_array(array, LABELS)) == _by_label(KEYPOINTS)
+
+def test_unknown_labels_are_dropped():
+    packed = pack_keypoints(KEYPOINTS + [{'label': 'zz', 'x': 1.0, 'y': 1.0, 'confidence': 1.0}], LABELS)
+
+    assert _by_label(keypoints_from_array(unpack_keypoints(packed, LABELS), LABELS)) == _by_label(KEYPOINTS)
+
+def test_label_version_depends_on_order():
+    assert label_version(LABELS) != label_version(list(reversed(LABELS)))
+
+@pytest.fixture
+def service(app, monkeypatch):
+    monkeypatch.setattr(keypoint_service, 'app', app)
+    monkeypatch.setattr(keypoint_service, '_labels', (LABELS, label_version(LABELS)))
+    return keypoint_service
+
+def _persist(service, user, storage, monkeypatch):
+    monkeypatch.setattr(service, 'keypoint_storage', storage)
+    detection_id = new_ulid()
+    service.persist_detections([({
+        'id': detection_id,
+        'user_id': user.id,
+        'image_path': 'image.jpg',
+        'confidence_score': 0.9,
+        'prediction_result': 'impacted',
+        'analysis': {}
+    }, KEYPOINTS)])
+    db.session.commit()
+    return detection_id
+
+@pytest.mark.parametrize('storage', ['rows', 'packed', 'both'])
+def test_detection_keypoints_read_back_in_every_storage_mode(service, user, monkeypatch, storage):
+    detection_id = _persist(service, user, storage, monkeypatch)
+
+    detection = service.get_detections_by_ids([detection_id])[detection_id]
+
+    assert _by_label(detection['keypoints']) == _by_label(KEYPOINTS)
+
+def test_repack_converts_row_only_detections(service, user, monkeypatch):
+    detection_id = _persist(service, user, 'rows', monkeypatch)
+
+    assert service.repack_keypoints(batch_size=1) == 1
+    assert service.repack_keypoints() == 0
+
+    from models import KeypointDetection
+    detection = db.session.get(KeypointDetection, detection_id)
+    assert service.packed_current(detection)
+    assert _by_label(service.get_keypoints(detection)) == _by_label(KEYPOINTS)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from services.scheduler import InferenceScheduler, INTERACTIVE, BULK
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+def _run_queued(scheduler, arrivals):
+    """Hold the only slot while arrivals queue up in order, then return the order they ran in"""
+    order = []
+    threads = []
+    release = threading.Event()
+
+    holder = threading.Thread(target=scheduler.run, args=(release.wait,), kwargs={'priority': BULK})
+    holder.start()
+    _wait_until(lambda: scheduler.stats()['running'] == 1)
+
+    for name, priority in arrivals:
+        queued = scheduler.stats()['classes'][priority]['queued']
+        thread = threading.Thread(target=scheduler.run, args=(order.append, name), kwargs={'priority': priority})
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: scheduler.stats()['classes'][priority]['queued'] == queued + 1)
+
+    release.set()
+    holder.join()
+    for thread in threads:
+        thread.join()
+    return order
+
+def test_strict_runs_interactive_ahead_of_queued_bulk():
+    scheduler = InferenceScheduler(concurrency=1, policy='strict')
+
+    order = _run_queued(scheduler, [('bulk-1', BULK), ('bulk-2', BULK), ('upload', INTERACTIVE)])
+
+    assert order == ['upload', 'bulk-1', 'bulk-2']
+
+def test_weighted_interleaves_by_weight():
+    scheduler = InferenceScheduler(concurrency=1, policy='weighted', weights={INTERACTIVE: 2, BULK: 1})
+    arrivals = [(f'bulk-{i}', BULK) for i in range(2)] + [(f'upload-{i}', INTERACTIVE) for i in range(4)]
+
+    order = _run_queued(scheduler, arrivals)
+
+    assert order == ['upload-0', 'upload-1', 'bulk-0', 'upload-2', 'upload-3', 'bulk-1']
+
+def test_starved_bulk_is_promoted():
+    scheduler = InferenceScheduler(concurrency=1, policy='strict', starvation_seconds=0.0)
+
+    order = _run_queued(scheduler, [('bulk', BULK), ('upload', INTERACTIVE)])
+
+    assert order == ['bulk', 'upload']
+    assert scheduler.stats()['classes'][BULK]['starvation_promotions'] >= 1
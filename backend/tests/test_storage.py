@@ -0,0 +1,41 @@
+import os
+import secrets
+
+import pytest
+
+from services.storage import BlobStore, KEY_PATTERN, ARTIFACT_KEY_BYTES
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore('uploads', root=str(tmp_path))
+
+def test_content_keys_are_sharded(store):
+    key = store.put_bytes(b'radiograph', 'jpg')
+
+    assert KEY_PATTERN.match(key)
+    assert store.path(key) == os.path.join(store.root, key[0:2], key[2:4], key)
+
+def test_identical_content_is_stored_once(store):
+    assert store.put_bytes(b'radiograph', 'jpg') == store.put_bytes(b'radiograph', 'jpg')
+
+def test_artifact_keys_are_sharded(store):
+    key = f"{secrets.token_hex(ARTIFACT_KEY_BYTES)}.png"
+
+    assert store.put_bytes(b'overlay', 'png', key=key) == key
+    assert store.path(key) == os.path.join(store.root, key[0:2], key[2:4], key)
+
+@pytest.mark.parametrize('filename', [
+    '0bad7ca2a25a418585d2ea681fa46954.jpg',
+    '0bad7ca2a25a418585d2ea681fa46954_result.jpg',
+    '0bad7ca2a25a418585d2ea681fa46954_seg_result.jpg'
+])
+def test_legacy_flat_files_are_found(store, filename):
+    with open(os.path.join(store.root, filename), 'wb') as f:
+        f.write(b'legacy')
+
+    assert not KEY_PATTERN.match(filename)
+    assert store.path(filename) == os.path.join(store.root, filename)
+
+@pytest.mark.parametrize('key', ['../secret.jpg', '.tmp', '', 'a/b.jpg'])
+def test_unsafe_keys_are_rejected(store, key):
+    assert store.path(key) is None
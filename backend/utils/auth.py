@@ -0,0 +1,29 @@
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+from models import User
+
+def current_user_is_admin():
+    """Return True if the request carries a valid token for an admin user"""
+    verify_jwt_in_request(optional=True)
+    user_id = get_jwt_identity()
+    if not user_id:
+        return False
+
+    user = User.query.get(user_id)
+    return user is not None and user.role == 'admin'
+
+def admin_required(fn):
+    """Require a valid JWT belonging to a user with the admin role"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_jwt_in_request()
+        if not current_user_is_admin():
+            return jsonify({
+                'status': 'error',
+                'message': 'Admin access required'
+            }), 403
+        return fn(*args, **kwargs)
+    return wrapper
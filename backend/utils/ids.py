@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+# Crockford base32, which keeps ULIDs lexicographically sortable
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+def _reset():
+    global _last_ms, _last_random
+    _last_ms = -1
+    _last_random = 0
+
+# A forked worker must not continue its parent's sequence within the same millisecond
+os.register_at_fork(after_in_child=_reset)
+
+def encode_ulid(timestamp_ms, randomness):
+    """Encode a 48-bit millisecond timestamp and 80 random bits as a 26 character ULID"""
+    value = (timestamp_ms << 80) | randomness
+    chars = []
+    for _ in range(26):
+        chars.append(ALPHABET[value & 0x1f])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+def new_ulid():
+    """Return a ULID that is unique without coordination and sorts by creation time.
+
+    Within a process, IDs generated in the same millisecond increment the random
+    part so they stay strictly increasing.
+    """
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            # Same millisecond, or the clock stepped back: keep counting from the last ID
+            now_ms = _last_ms
+            randomness = _last_random + 1
+            if randomness >> 80:
+                now_ms += 1
+                randomness = int.from_bytes(os.urandom(10), 'big')
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+
+        _last_ms = now_ms
+        _last_random = randomness
+        return encode_ulid(now_ms, randomness)
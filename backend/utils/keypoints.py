@@ -0,0 +1,33 @@
+import hashlib
+
+import numpy as np
+
+# Packed layout: one float32 (x, y, confidence) row per label, in label map order
+PACKED_DTYPE = np.dtype('<f4')
+PACKED_COLUMNS = 3
+
+def label_version(labels):
+    """Short digest of the label order, stored next to packed arrays"""
+    return hashlib.sha1(','.join(labels).encode()).hexdigest()[:12]
+
+def pack_keypoints(keypoints, labels):
+    """Pack keypoint dicts into a fixed-order float32 array; missing labels are NaN"""
+    index = {label: i for i, label in enumerate(labels)}
+    array = np.full((len(labels), PACKED_COLUMNS), np.nan, dtype=PACKED_DTYPE)
+    for keypoint in keypoints:
+        i = index.get(keypoint['label'])
+        if i is not None:
+            array[i] = (keypoint['x'], keypoint['y'], keypoint['confidence'])
+    return array.tobytes()
+
+def unpack_keypoints(data, labels):
+    """Decode a packed column into a (len(labels), 3) array without copying"""
+    return np.frombuffer(data, dtype=PACKED_DTYPE).reshape(len(labels), PACKED_COLUMNS)
+
+def keypoints_from_array(array, labels):
+    """Convert an unpacked array back into the keypoint dicts the API returns"""
+    return [
+        {'label': label, 'x': float(x), 'y': float(y), 'confidence': float(confidence)}
+        for label, (x, y, confidence) in zip(labels, array.tolist())
+        if not np.isnan(x)
+    ]
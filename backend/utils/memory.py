@@ -0,0 +1,206 @@
+import ctypes
+import gc
+import os
+import random
+import resource
+import signal
+import threading
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+from utils.metrics import PROCESS_RSS, REQUEST_RSS_DELTA
+
+# Types that hold image-sized buffers on the inference path. NumPy arrays are not
+# tracked by the garbage collector, so they are accounted through tracemalloc instead
+WATCHED_TYPES = ('Results', 'Tensor', 'Image', 'JpegImageFile', 'PngImageFile')
+
+try:
+    # NumPy reports its data buffers to tracemalloc under this domain
+    import numpy as np
+    NUMPY_DOMAIN = np.lib.tracemalloc_domain
+except (ImportError, AttributeError):
+    NUMPY_DOMAIN = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# tracemalloc is process-wide; sampled requests on different threads share one tracing session
+_tracing_lock = threading.Lock()
+_tracing = {'samples': 0, 'started': False}
+
+def current_rss():
+    """Return the current resident set size in bytes"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is the peak rather than the current value, but it is all macOS offers
+        return peak_rss()
+
+def peak_rss():
+    """Return the peak resident set size in bytes"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+def count_watched_objects():
+    counts = Counter()
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in WATCHED_TYPES:
+            counts[name] += 1
+    return counts
+
+def release_cached_memory():
+    """Hand freed memory back to the OS: Python garbage, the torch CUDA cache and the glibc heap"""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def top_allocation_sites(limit=10, snapshot=None):
+    if snapshot is None:
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot()
+    return [
+        {'site': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+def _acquire_tracing(frames):
+    """Register a sampled request, starting tracemalloc if nothing has it on yet"""
+    with _tracing_lock:
+        if _tracing['samples'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _tracing['started'] = True
+        _tracing['samples'] += 1
+
+def _release_tracing():
+    """Stop tracemalloc once the last sampled request is done, unless someone else started it"""
+    with _tracing_lock:
+        _tracing['samples'] -= 1
+        if _tracing['samples'] == 0 and _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+def init_app(app):
+    """Per-request memory sampling plus an optional RSS watchdog.
+
+    MEMORY_SAMPLE_RATE       fraction of requests that get full accounting
+    MEMORY_LARGE_ALLOCATION  bytes above which an allocation site is reported
+    MEMORY_RECYCLE_RSS_MB    RSS after which the worker is recycled (0 = off)
+    MEMORY_WATCHDOG_TRACE    keep tracemalloc on so the watchdog can log allocation sites
+    """
+    app.config.setdefault('MEMORY_SAMPLE_RATE', float(os.environ.get('MEMORY_SAMPLE_RATE', 0.0)))
+    app.config.setdefault('MEMORY_LARGE_ALLOCATION', int(os.environ.get('MEMORY_LARGE_ALLOCATION', 1 << 20)))
+    app.config.setdefault('MEMORY_RECYCLE_RSS_MB', int(os.environ.get('MEMORY_RECYCLE_RSS_MB', 0)))
+    app.config.setdefault('MEMORY_TRACEMALLOC_FRAMES', int(os.environ.get('MEMORY_TRACEMALLOC_FRAMES', 5)))
+    app.config.setdefault('MEMORY_WATCHDOG_TRACE', os.environ.get('MEMORY_WATCHDOG_TRACE', '0') == '1')
+
+    sample_rate = app.config['MEMORY_SAMPLE_RATE']
+    recycle_bytes = app.config['MEMORY_RECYCLE_RSS_MB'] * 1024 * 1024
+    state = {'recycling': False}
+
+    # Allocation tracing slows every allocation down, so the watchdog only keeps it on when asked
+    if recycle_bytes and app.config['MEMORY_WATCHDOG_TRACE'] and not tracemalloc.is_tracing():
+        tracemalloc.start(app.config['MEMORY_TRACEMALLOC_FRAMES'])
+
+    @app.before_request
+    def start_memory_sample():
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return
+
+        _acquire_tracing(app.config['MEMORY_TRACEMALLOC_FRAMES'])
+        g.memory_tracing = True
+
+        g.memory_sample = {
+            'rss': current_rss(),
+            'objects': count_watched_objects(),
+            'snapshot': tracemalloc.take_snapshot()
+        }
+
+    @app.after_request
+    def finish_memory_sample(response):
+        sample = g.pop('memory_sample', None)
+        if sample is not None:
+            try:
+                _report_sample(app, sample)
+            except Exception as e:
+                # Diagnostics must never turn a good response into a 500
+                app.logger.warning(f"Memory sample failed: {str(e)}")
+
+        rss = current_rss()
+        PROCESS_RSS.set(rss)
+
+        if recycle_bytes and rss > recycle_bytes and not state['recycling']:
+            release_cached_memory()
+            rss = current_rss()
+            if rss > recycle_bytes:
+                state['recycling'] = True
+                _recycle_worker(app, response, rss, recycle_bytes)
+
+        return response
+
+    @app.teardown_request
+    def stop_memory_sample(exc):
+        # Runs even when the view raised, so the tracing refcount never leaks
+        if g.pop('memory_tracing', False):
+            _release_tracing()
+
+def _report_sample(app, sample):
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot()
+    large = app.config['MEMORY_LARGE_ALLOCATION']
+
+    large_allocations = [
+        {'site': str(stat.traceback[0]), 'size_diff_bytes': stat.size_diff, 'count_diff': stat.count_diff}
+        for stat in snapshot.compare_to(sample['snapshot'], 'lineno')
+        if stat.size_diff >= large
+    ][:10]
+
+    objects = count_watched_objects()
+    retained = {name: objects[name] - sample['objects'].get(name, 0) for name in objects}
+    rss_after = current_rss()
+    rss_delta = rss_after - sample['rss']
+
+    REQUEST_RSS_DELTA.labels(endpoint=request.endpoint or 'unknown').observe(max(rss_delta, 0))
+    app.logger.info(
+        f"Memory sample {request.method} {request.path}: "
+        f"rss_before={sample['rss']} rss_after={rss_after} rss_delta={rss_delta} "
+        f"retained={ {k: v for k, v in retained.items() if v} } "
+        f"retained_arrays={_retained_arrays(snapshot, sample['snapshot'])} large_allocations={large_allocations}"
+    )
+
+def _retained_arrays(snapshot, baseline, limit=5):
+    """NumPy buffers still allocated since the baseline snapshot, by allocating call stack"""
+    if NUMPY_DOMAIN is None:
+        return []
+    only_numpy = [tracemalloc.DomainFilter(True, NUMPY_DOMAIN)]
+    stats = snapshot.filter_traces(only_numpy).compare_to(baseline.filter_traces(only_numpy), 'traceback')
+    return [
+        {'site': str(stat.traceback[-1]), 'size_diff_bytes': stat.size_diff, 'count_diff': stat.count_diff}
+        for stat in stats
+        if stat.size_diff > 0
+    ][:limit]
+
+def _recycle_worker(app, response, rss, limit):
+    app.logger.warning(
+        f"Worker {os.getpid()} RSS {rss // (1024 * 1024)}MB exceeds {limit // (1024 * 1024)}MB; "
+        f"top allocation sites: {top_allocation_sites()}; watched objects: {dict(count_watched_objects())}"
+    )
+
+    if 'gunicorn' not in request.environ.get('SERVER_SOFTWARE', ''):
+        app.logger.warning("Not running under gunicorn, worker will not be recycled")
+        return
+
+    # SIGTERM after the response is sent; gunicorn finishes in-flight work and starts a fresh worker
+    pid = os.getpid()
+    response.call_on_close(lambda: os.kill(pid, signal.SIGTERM))
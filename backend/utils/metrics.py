@@ -0,0 +1,73 @@
+import os
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+from utils.tracing import span
+
+# Buckets cover everything from JSON encoding (sub-millisecond) to CPU inference (seconds)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_LATENCY = Histogram(
+    'pipeline_stage_seconds',
+    'Time spent in each stage of the analysis pipeline',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+
+PREDICTIONS = Counter(
+    'detections_total',
+    'Stored detections by prediction result',
+    ['prediction_result']
+)
+
+INFERENCE_QUEUE_DEPTH = Gauge(
+    'inference_queue_depth',
+    'Model calls waiting for a slot, by priority class',
+    ['priority'],
+    multiprocess_mode='livesum'
+)
+
+INFERENCE_QUEUE_TIME = Histogram(
+    'inference_queue_seconds',
+    'Time model calls waited for a slot, by priority class',
+    ['priority'],
+    buckets=STAGE_BUCKETS
+)
+
+MODEL_LOADED = Gauge(
+    'model_loaded',
+    '1 if the model is loaded in every live worker, 0 otherwise',
+    ['model'],
+    multiprocess_mode='livemin'
+)
+
+PROCESS_RSS = Gauge(
+    'process_rss_bytes',
+    'Resident set size of each worker process',
+    multiprocess_mode='liveall'
+)
+
+REQUEST_RSS_DELTA = Histogram(
+    'request_rss_delta_bytes',
+    'RSS growth over a sampled request',
+    ['endpoint'],
+    buckets=(0, 1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20, 1 << 30)
+)
+
+@contextmanager
+def stage(name):
+    """Record the duration of a pipeline stage in the stage histogram and as a trace span"""
+    with STAGE_LATENCY.labels(stage=name).time(), span(name):
+        yield
+
+def render():
+    """Return (body, content_type) for a scrape, merged across gunicorn workers if configured"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,17 @@
+import base64
+import json
+from datetime import datetime
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor for the row a page ended on"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
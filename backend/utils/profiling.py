@@ -0,0 +1,78 @@
+import os
+import time
+import uuid
+
+from flask import g, request, jsonify
+
+from utils.auth import current_user_is_admin
+
+PROFILE_HEADER = 'X-Profile'
+
+def _profiling_requested():
+    return request.headers.get(PROFILE_HEADER) == '1' or request.args.get('profile') == '1'
+
+def init_app(app):
+    """Run flagged requests under a sampling profiler.
+
+    Admins opt a single request in with an ``X-Profile: 1`` header or a
+    ``?profile=1`` query flag. The profile is written in speedscope format (a
+    flame-graph viewer format) and its id returned in ``X-Profile-Id``. Requests
+    without the flag only pay for the header lookup.
+    """
+    app.config.setdefault('PROFILE_FOLDER', os.path.join(app.root_path, 'profiles'))
+    app.config.setdefault('PROFILE_ENDPOINTS', {
+        'prediction.analyze_image',
+        'prediction.analyze_batch',
+        'prediction.get_history',
+        'prediction.get_detection'
+    })
+    app.config.setdefault('PROFILE_INTERVAL', 0.001)
+
+    @app.before_request
+    def start_profiler():
+        if not _profiling_requested() or request.endpoint not in app.config['PROFILE_ENDPOINTS']:
+            return None
+
+        if not current_user_is_admin():
+            return jsonify({
+                'status': 'error',
+                'message': 'Profiling requires the admin role'
+            }), 403
+
+        # Imported here so the profiler is never loaded unless it is used
+        from pyinstrument import Profiler
+
+        g.profiler = Profiler(interval=app.config['PROFILE_INTERVAL'], async_mode='disabled')
+        g.profiler.start()
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}_{request.endpoint.split('.')[-1]}_{uuid.uuid4().hex[:8]}"
+        description = f"{request.method} {request.path}"
+        if response.is_streamed:
+            # The body (e.g. /analyze/batch NDJSON) is generated after this hook; keep sampling until it is sent
+            response.call_on_close(lambda: _store_profile(app, profiler, profile_id, description))
+        else:
+            _store_profile(app, profiler, profile_id, description)
+
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+def _store_profile(app, profiler, profile_id, description):
+    try:
+        profiler.stop()
+
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+        profile_path = os.path.join(app.config['PROFILE_FOLDER'], f"{profile_id}.speedscope.json")
+        with open(profile_path, 'w') as f:
+            f.write(profiler.output(renderer=SpeedscopeRenderer()))
+
+        app.logger.info(f"Stored profile {profile_id} for {description}")
+    except Exception as e:
+        app.logger.error(f"Could not store profile {profile_id}: {str(e)}")
@@ -0,0 +1,234 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TRACE_HEADER = 'X-Trace-Id'
+
+_current_trace = ContextVar('current_trace', default=None)
+_current_span = ContextVar('current_span', default=None)
+
+class TraceExporter:
+    """Ships finished traces from a background thread so requests never block on I/O"""
+
+    def __init__(self, kind='file', path=None, url=None, max_queue=1000):
+        self.kind = kind
+        self.path = path
+        self.url = url
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self.thread.start()
+
+    def export(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.kind == 'http':
+                    self._post(batch)
+                else:
+                    self._write(batch)
+            except Exception:
+                # Tracing must never take the service down; the batch is lost
+                self.dropped += len(batch)
+
+    def _write(self, batch):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            for trace in batch:
+                f.write(json.dumps(trace) + '\n')
+
+    def _post(self, batch):
+        data = json.dumps({'traces': batch}).encode()
+        req = urllib.request.Request(self.url, data=data, headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(req, timeout=5).close()
+
+_exporter = None
+
+# Guards each trace's count of background work that still adds spans to it
+_pending_lock = threading.Lock()
+
+@contextmanager
+def span(name, **attributes):
+    """Record a timed span under the current trace; a no-op when the request is not sampled"""
+    trace = _current_trace.get()
+    if trace is None or not trace['sampled']:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = {
+        'span_id': uuid.uuid4().hex[:16],
+        'parent_id': parent['span_id'] if parent else None,
+        'name': name,
+        'start': time.time(),
+        'attributes': attributes,
+        'status': 'ok'
+    }
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current['status'] = 'error'
+        current['attributes']['error'] = str(e)
+        raise
+    finally:
+        current['duration_ms'] = (time.perf_counter() - started) * 1000
+        _current_span.reset(token)
+        trace['spans'].append(current)
+
+def traced(name=None):
+    """Decorator that wraps a function call in a span"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def hold_trace():
+    """Keep the current trace from being exported until the returned release() is called.
+
+    For work that outlives the request but records spans into its trace, such as
+    artifact writes; the trace is exported once the request and every hold are done.
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace['sampled']:
+        return lambda: None
+
+    with _pending_lock:
+        trace['pending'] += 1
+    released = threading.Event()
+
+    def release():
+        if released.is_set():
+            return
+        released.set()
+        with _pending_lock:
+            trace['pending'] -= 1
+            ready = trace['finished'] and trace['pending'] == 0
+        if ready:
+            _export(trace)
+    return release
+
+def _finish(trace):
+    with _pending_lock:
+        trace['finished'] = True
+        ready = trace['pending'] == 0
+    if ready:
+        _export(trace)
+
+def _export(trace):
+    if _exporter is not None:
+        _exporter.export({key: trace[key] for key in ('trace_id', 'sampled', 'spans')})
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace['trace_id'] if trace else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is None or not trace['sampled']:
+        return
+    manager = span('sql', statement=statement[:500], executemany=executemany)
+    manager.__enter__()
+    conn.info.setdefault('trace_spans', []).append(manager)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get('trace_spans') if connection is not None else None
+    if spans:
+        error = exception_context.original_exception
+        spans.pop().__exit__(type(error), error, None)
+
+def init_app(app):
+    """Start a trace per request, sample at TRACE_SAMPLE_RATE and export finished traces.
+
+    Every response carries an X-Trace-Id header. An incoming X-Trace-Id is reused
+    so a trace can be joined with upstream logs.
+    """
+    global _exporter
+
+    app.config.setdefault('TRACE_SAMPLE_RATE', float(os.environ.get('TRACE_SAMPLE_RATE', 0.0)))
+    app.config.setdefault('TRACE_EXPORTER', os.environ.get('TRACE_EXPORTER', 'file'))
+    app.config.setdefault('TRACE_FILE', os.environ.get('TRACE_FILE', os.path.join(app.root_path, 'traces', 'traces.jsonl')))
+    app.config.setdefault('TRACE_COLLECTOR_URL', os.environ.get('TRACE_COLLECTOR_URL'))
+
+    sample_rate = app.config['TRACE_SAMPLE_RATE']
+    if sample_rate > 0 and _exporter is None:
+        kind = 'http' if app.config['TRACE_EXPORTER'] == 'http' and app.config['TRACE_COLLECTOR_URL'] else 'file'
+        _exporter = TraceExporter(kind=kind, path=app.config['TRACE_FILE'], url=app.config['TRACE_COLLECTOR_URL'])
+        app.logger.info(f"Tracing enabled: sample_rate={sample_rate}, exporter={kind}")
+
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_trace():
+        trace = {
+            'trace_id': request.headers.get(TRACE_HEADER) or uuid.uuid4().hex,
+            'sampled': sample_rate > 0 and random.random() < sample_rate,
+            'spans': [],
+            'pending': 0,
+            'finished': False
+        }
+        g.trace_token = _current_trace.set(trace)
+        if trace['sampled']:
+            g.trace_root = span(request.endpoint or 'request', method=request.method, path=request.path)
+            g.trace_root.__enter__()
+
+    @app.after_request
+    def add_trace_header(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers[TRACE_HEADER] = trace_id
+        return response
+
+    @app.teardown_request
+    def finish_trace(error=None):
+        trace = _current_trace.get()
+        root = g.pop('trace_root', None)
+        if root is not None:
+            if error is not None:
+                root.__exit__(type(error), error, None)
+            else:
+                root.__exit__(None, None, None)
+
+        token = g.pop('trace_token', None)
+        if token is not None:
+            _current_trace.reset(token)
+
+        if trace and trace['sampled']:
+            _finish(trace)
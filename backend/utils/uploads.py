@@ -0,0 +1,75 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import Request, current_app
+from PIL import Image
+
+# Formats /analyze accepts, by Pillow format name
+ACCEPTED_FORMATS = ('JPEG', 'PNG')
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """Spooled file that hashes the bytes as the form parser writes them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return super().write(data)
+
+class CappedFile(io.FileIO):
+    """Staging file that keeps at most max_size bytes and drops the rest of the part.
+
+    The form parser keeps writing; truncated tells the caller the part was too
+    large, without an oversized image ever reaching the disk.
+    """
+
+    def __init__(self, path, max_size=None):
+        super().__init__(path, 'w+')
+        self.max_size = max_size
+        self.written = 0
+        self.truncated = False
+
+    def write(self, data):
+        self.written += len(data)
+        if self.max_size is not None and self.written > self.max_size:
+            self.truncated = True
+            return len(data)
+        return super().write(data)
+
+class SpooledRequest(Request):
+    """Request whose file parts stay in memory only up to UPLOAD_SPOOL_THRESHOLD bytes"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        spool_dir = config.get('UPLOAD_SPOOL_FOLDER')
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        return HashingSpooledFile(
+            max_size=config.get('UPLOAD_SPOOL_THRESHOLD', 512 * 1024),
+            dir=spool_dir
+        )
+
+def stream_size(stream):
+    """Return the size of a seekable stream without reading it"""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def inspect_image(stream):
+    """Return (format, width, height) parsed from the image header, rewinding the stream.
+
+    Pillow only reads the header here, so the pixel data is never decoded.
+    Raises an exception when the header is not a supported image.
+    """
+    position = stream.tell()
+    try:
+        with Image.open(stream) as image:
+            return image.format, image.width, image.height
+    finally:
+        stream.seek(position)
@@ -9,36 +9,56 @@ type HistoryItem = {
   confidence_score: number;
   prediction_result: string;
   created_at: string;
-  analysis?: unknown;
+  side?: string | null;
+  sector?: number | null;
+  impaction_type?: string | null;
+  difficult_factors?: number | null;
+  keypoint_coverage?: number | null;
+  thumbnail_url?: string;
+  preview_url?: string;
+  result_thumbnail_url?: string;
+  result_preview_url?: string;
 };
 
 const PredictionHistoryPanel = () => {
   const [history, setHistory] = useState<HistoryItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const navigate = useNavigate();
 
-  useEffect(() => {
-    const fetchHistory = async () => {
-      try {
-        const response = await axiosInstance.get('/history');
-
-        if (response.data.status === "success") {
-          setHistory(response.data.history || []);
-        } else {
-          setError("Failed to fetch prediction history");
-        }
-      } catch (err) {
-        console.error("Error fetching history:", err);
-        setError("Error loading history");
-      } finally {
-        setLoading(false);
+  // Fetch one page; the server returns next_cursor until the last page
+  const fetchHistory = async (cursor?: string) => {
+    try {
+      const response = await axiosInstance.get('/history', {
+        params: cursor ? { cursor } : {},
+      });
+
+      if (response.data.status === "success") {
+        const page: HistoryItem[] = response.data.history || [];
+        setHistory((previous) => (cursor ? [...previous, ...page] : page));
+        setNextCursor(response.data.next_cursor || null);
+      } else {
+        setError("Failed to fetch prediction history");
       }
-    };
+    } catch (err) {
+      console.error("Error fetching history:", err);
+      setError("Error loading history");
+    }
+  };
 
-    fetchHistory();
+  useEffect(() => {
+    fetchHistory().finally(() => setLoading(false));
   }, []);
 
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    await fetchHistory(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleViewResult = (id: string) => {
     navigate(`/prediction/${id}`);
   };
@@ -122,6 +142,7 @@ const PredictionHistoryPanel = () => {
           <table className="w-full text-left">
             <thead className="text-xs uppercase bg-gray-50">
               <tr>
+                <th className="px-4 py-3">Image</th>
                 <th className="px-4 py-3">ID</th>
                 <th className="px-4 py-3">Date</th>
                 <th className="px-4 py-3">Result</th>
@@ -132,6 +153,19 @@ const PredictionHistoryPanel = () => {
             <tbody>
               {history.map((item) => (
                 <tr key={item.id} className="border-b border-gray-300">
+                  <td className="px-4 py-3">
+                    {item.thumbnail_url && (
+                      <img
+                        src={`${axiosInstance.defaults.baseURL}${item.thumbnail_url}`}
+                        alt="X-ray thumbnail"
+                        loading="lazy"
+                        className="h-12 w-20 object-cover rounded"
+                        onError={(e) => {
+                          (e.target as HTMLImageElement).style.visibility = "hidden";
+                        }}
+                      />
+                    )}
+                  </td>
                   <td className="px-4 py-3">{item.id}</td>
                   <td className="px-4 py-3">{formatDate(item.created_at)}</td>
                   <td className="px-4 py-3">
@@ -165,6 +199,18 @@ const PredictionHistoryPanel = () => {
               ))}
             </tbody>
           </table>
+
+          {nextCursor && (
+            <div className="flex justify-center mt-4">
+              <button
+                onClick={handleLoadMore}
+                disabled={loadingMore}
+                className="px-4 py-2 rounded-lg bg-gray-100 text-gray-700 border border-gray-200 hover:bg-gray-200 text-sm cursor-pointer disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
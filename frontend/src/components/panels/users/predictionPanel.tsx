@@ -146,6 +146,10 @@ const PredictionPanel = () => {
   const [originalImage, setOriginalImage] = useState<string>("");
   const [resultImage, setResultImage] = useState<string>("");
   const [segmentationImage, setSegmentationImage] = useState<string>("");
+  // Downscaled previews for the inline views; the modals keep the full-size images
+  const [originalPreview, setOriginalPreview] = useState<string>("");
+  const [resultPreview, setResultPreview] = useState<string>("");
+  const [segmentationPreview, setSegmentationPreview] = useState<string>("");
   const [activeSide, setActiveSide] = useState<string>("right");
 
   // State for interactive view
@@ -184,6 +188,9 @@ const PredictionPanel = () => {
               setSegmentationImage(
                 `${axiosInstance.defaults.baseURL}/results/${segFilename}`,
               );
+              setSegmentationPreview(
+                `${axiosInstance.defaults.baseURL}/results/preview/${segFilename}`,
+              );
             }
           }
 
@@ -202,6 +209,12 @@ const PredictionPanel = () => {
           setResultImage(
             `${axiosInstance.defaults.baseURL}/results/${resultFilename}`,
           );
+          setOriginalPreview(
+            `${axiosInstance.defaults.baseURL}/uploads/preview/${originalFilename}`,
+          );
+          setResultPreview(
+            `${axiosInstance.defaults.baseURL}/results/preview/${resultFilename}`,
+          );
           setTimeout(() => setLoading(false), 200);
         } else {
           setError(
@@ -412,7 +425,7 @@ const PredictionPanel = () => {
             <div className="relative flex justify-center">
               {/* Original image - Clicking opens full size view */}
               <img
-                src={originalImage}
+                src={originalPreview || originalImage}
                 alt="Original X-ray"
                 className="max-h-80 object-contain hover:opacity-90 transition-opacity cursor-pointer"
                 onClick={() => openImageModal(originalImage, "Original X-ray")}
@@ -447,7 +460,7 @@ const PredictionPanel = () => {
             </div>
             <div className="flex justify-center">
               <img
-                src={resultImage}
+                src={resultPreview || resultImage}
                 alt="Analysis with keypoints"
                 className="max-h-80 object-contain hover:opacity-90 transition-opacity cursor-pointer"
                 onClick={() =>
@@ -481,7 +494,7 @@ const PredictionPanel = () => {
               </div>
               <div className="flex justify-center">
                 <img
-                  src={segmentationImage}
+                  src={segmentationPreview || segmentationImage}
                   alt="Tooth segmentation"
                   className="max-h-80 object-contain hover:opacity-90 transition-opacity cursor-pointer"
                   onClick={() =>
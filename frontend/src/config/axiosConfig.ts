@@ -19,6 +19,15 @@ const axiosParams = {
 // Create instance
 const axiosInstance: AxiosInstance = axios.create(axiosParams);
 
+// Database position of this client's last write, so replica reads never miss it.
+// Shared by every tab through localStorage.
+const DB_POSITION_HEADER = "X-DB-Position";
+
+// Also called with the db_position field of the last /analyze/batch NDJSON line
+export const storeDbPosition = (position: string) => {
+  localStorage.setItem(DB_POSITION_HEADER, position);
+};
+
 // Add a request interceptor
 axiosInstance.interceptors.request.use(
   (config) => {
@@ -27,6 +36,10 @@ axiosInstance.interceptors.request.use(
     if (token) {
       config.headers["Authorization"] = `Bearer ${token}`;
     }
+    const dbPosition = localStorage.getItem(DB_POSITION_HEADER);
+    if (dbPosition) {
+      config.headers[DB_POSITION_HEADER] = dbPosition;
+    }
     return config;
   },
   (error) => {
@@ -35,4 +48,13 @@ axiosInstance.interceptors.request.use(
   },
 );
 
+// Remember the position returned after uploads and other writes
+axiosInstance.interceptors.response.use((response) => {
+  const position = response.headers[DB_POSITION_HEADER.toLowerCase()];
+  if (position) {
+    storeDbPosition(position);
+  }
+  return response;
+});
+
 export default axiosInstance;